@@ -0,0 +1,56 @@
+"""
+Measure the bytes and tokens removed by the cross-page boilerplate index.
+
+Usage:
+    python benchmarks/boilerplate_benchmark.py [pages_dir]
+
+pages_dir holds saved pages (*.html) of one site and defaults to the
+fixture site in benchmarks/fixtures/acme.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.boilerplate import BoilerplateIndex
+from common.context import count_tokens
+from common.extract import extract
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "acme"
+
+
+def run(pages_dir):
+    paths = sorted(Path(pages_dir).glob("*.html"))
+    if not paths:
+        raise SystemExit(f"No *.html pages found in {pages_dir}")
+    texts = {path.name: extract(path.read_bytes()).text for path in paths}
+
+    index = BoilerplateIndex()
+    for name, text in texts.items():
+        index.add(text, key=name)
+
+    print(f"{'page':<20}{'bytes':>8}{'after':>8}{'tokens':>8}{'after':>8}")
+    totals = [0, 0, 0, 0]
+    for name, text in texts.items():
+        stripped = index.strip(text)
+        row = [
+            len(text.encode()),
+            len(stripped.encode()),
+            count_tokens(text),
+            count_tokens(stripped),
+        ]
+        totals = [total + value for total, value in zip(totals, row)]
+        print(f"{name:<20}" + "".join(f"{value:>8}" for value in row))
+
+    print(f"{'total':<20}" + "".join(f"{value:>8}" for value in totals))
+    print(
+        f"\nSaved {1 - totals[1] / totals[0]:.0%} of bytes and "
+        f"{1 - totals[3] / totals[2]:.0%} of tokens across {len(texts)} pages"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("pages_dir", nargs="?", default=FIXTURES)
+    run(parser.parse_args().pages_dir)
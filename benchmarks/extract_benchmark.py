@@ -0,0 +1,62 @@
+"""
+Compare the HTML extraction backends in common/extract.py.
+
+Usage:
+    python benchmarks/extract_benchmark.py [pages_dir ...] [--repeat N]
+
+pages_dir defaults to the saved fixture site in benchmarks/fixtures/acme plus
+the malformed pages in benchmarks/fixtures/quirks. Drop saved pages (*.html)
+of real sites into any directory to benchmark them.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.extract import BACKENDS, available_backends
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def load_pages(pages_dirs):
+    paths = [path for d in pages_dirs for path in sorted(Path(d).glob("*.html"))]
+    if not paths:
+        raise SystemExit(f"No *.html pages found in {', '.join(map(str, pages_dirs))}")
+    return [path.read_bytes() for path in paths]
+
+
+def run(pages, repeat):
+    reference = [BACKENDS["bs4"](page) for page in pages]
+    total_bytes = sum(len(page) for page in pages) * repeat
+    baseline = None
+
+    print(f"{len(pages)} pages, {total_bytes / 1024:.0f} KiB parsed per backend\n")
+    print(f"{'backend':<12}{'seconds':>10}{'MiB/s':>10}{'speedup':>10}  same output")
+    for name in ["bs4"] + [b for b in available_backends() if b != "bs4"]:
+        extract = BACKENDS[name]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            results = [extract(page) for page in pages]
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        same = all(
+            (r.title, r.text, r.links, r.anchors)
+            == (e.title, e.text, e.links, e.anchors)
+            for r, e in zip(results, reference)
+        )
+        print(
+            f"{name:<12}{elapsed:>10.3f}{total_bytes / elapsed / 2**20:>10.2f}"
+            f"{baseline / elapsed:>9.1f}x  {'yes' if same else 'NO'}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "pages_dir", nargs="*", default=[FIXTURES / "acme", FIXTURES / "quirks"]
+    )
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    run(load_pages(args.pages_dir), args.repeat)
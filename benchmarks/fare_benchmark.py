@@ -0,0 +1,116 @@
+"""
+Fare lookup time at 100k routes, indexed store vs. a linear fuzzy scan.
+
+Usage:
+    python benchmarks/fare_benchmark.py [--cities N] [--origins M] [--lookups K]
+
+Builds N synthetic cities with M origins each (N * M routes) in memory and in
+a temporary SQLite file, then times exact, respelled, misspelled and prefix
+lookups. The baseline is difflib over every city name, which is what a fuzzy
+match without an index has to do.
+"""
+
+import argparse
+import difflib
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.fares import FareStore, SqliteFareStore, normalize_city
+
+SYLLABLES = ["va", "ra", "na", "si", "ti", "ru", "pa", "dha", "ma", "ya", "bel", "ur"]
+
+
+def city_names(count, rng):
+    names = set()
+    while len(names) < count:
+        names.add("".join(rng.choices(SYLLABLES, k=rng.randint(3, 5))))
+    return sorted(names)
+
+
+def queries(cities, count, rng):
+    """Return: (kind, query, city) samples of the ways a city gets typed"""
+    samples = []
+    for _ in range(count):
+        city = rng.choice(cities)
+        position = rng.randrange(1, len(city))
+        samples.append(("exact", city.title(), city))
+        samples.append(("respelled", city.replace("dha", "da"), city))
+        samples.append(("misspelled", city[:position] + city[position + 1 :], city))
+        samples.append(("prefix", city[: len(city) - 2], city))
+    return samples
+
+
+def time_lookups(lookup, samples, expected):
+    timings = {}
+    found = {}
+    for kind, query, city in samples:
+        start = time.perf_counter()
+        price = lookup(query)
+        timings[kind] = timings.get(kind, 0.0) + time.perf_counter() - start
+        found[kind] = found.get(kind, 0) + (price == expected[city])
+    per_kind = len(samples) // len(timings)
+    return {
+        kind: (timings[kind] / per_kind * 1e6, found[kind] / per_kind)
+        for kind in timings
+    }
+
+
+def run(cities_count, origins, lookups):
+    rng = random.Random(42)
+    cities = city_names(cities_count, rng)
+    rows = [
+        (city, f"₹{rng.randrange(2_000, 40_000)}", f"origin{origin}", "")
+        for city in cities
+        for origin in range(origins)
+    ]
+    samples = queries(cities, lookups, rng)
+    expected = {city: price for city, price, origin, _ in rows if origin == "origin0"}
+
+    memory = FareStore()
+    start = time.perf_counter()
+    memory.add_many(rows)
+    print(f"{len(rows):,} routes, {len(cities):,} cities")
+    print(f"in-memory index built in {time.perf_counter() - start:.2f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite = SqliteFareStore(Path(directory) / "fares.sqlite")
+        start = time.perf_counter()
+        sqlite.add_many(rows)
+        print(f"sqlite table built in {time.perf_counter() - start:.2f}s\n")
+
+        names = {normalize_city(city): city for city in cities}
+
+        def linear(query):
+            match = difflib.get_close_matches(normalize_city(query), names, n=1)
+            return expected[names[match[0]]] if match else None
+
+        results = {
+            "in-memory": time_lookups(
+                lambda query: memory.price(query, "origin0"), samples, expected
+            ),
+            "sqlite": time_lookups(
+                lambda query: sqlite.price(query, "origin0"), samples, expected
+            ),
+            # Far slower, so it is timed on a sample of the lookups
+            "linear difflib": time_lookups(
+                linear, samples[: len(samples) // 20], expected
+            ),
+        }
+
+    print(f"{'store':<16}{'lookup':<12}{'us/lookup':>12}{'found':>8}")
+    for store, kinds in results.items():
+        for kind, (micros, found) in kinds.items():
+            print(f"{store:<16}{kind:<12}{micros:>12.1f}{found:>8.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cities", type=int, default=2_000)
+    parser.add_argument("--origins", type=int, default=50)
+    parser.add_argument("--lookups", type=int, default=2_000)
+    args = parser.parse_args()
+    run(args.cities, args.origins, args.lookups)
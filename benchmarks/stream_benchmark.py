@@ -0,0 +1,71 @@
+"""
+Bytes pushed to the UI per streamed answer, before and after coalescing.
+
+Usage:
+    python benchmarks/stream_benchmark.py [--tokens N] [--tokens-per-second R]
+
+Simulates a model streaming N tokens at R tokens/second on a virtual clock,
+so it runs instantly and needs no API key.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.streaming import accumulate, coalesce
+
+TOKEN = "word "  # ~1 token of English text
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def deltas(tokens, tokens_per_second, clock):
+    for _ in range(tokens):
+        clock.now += 1 / tokens_per_second
+        yield TOKEN
+
+
+def before(tokens, tokens_per_second):
+    # The old generators: result += delta; yield result for every token
+    clock = VirtualClock()
+    result = ""
+    updates = []
+    for delta in deltas(tokens, tokens_per_second, clock):
+        result += delta
+        updates.append(result)
+    return updates
+
+
+def run(tokens, tokens_per_second):
+    old = before(tokens, tokens_per_second)
+
+    clock = VirtualClock()
+    new = list(accumulate(deltas(tokens, tokens_per_second, clock), clock=clock))
+
+    clock = VirtualClock()
+    appended = list(coalesce(deltas(tokens, tokens_per_second, clock), clock=clock))
+
+    rows = [
+        ("per token, full text", len(old), sum(len(u.encode()) for u in old)),
+        ("coalesced, full text", len(new), sum(len(u.encode()) for u in new)),
+        ("coalesced, appended", len(appended), sum(len(u.encode()) for u in appended)),
+    ]
+    print(f"{tokens} tokens at {tokens_per_second} tokens/s\n")
+    print(f"{'updates sent as':<24}{'updates':>10}{'bytes':>14}")
+    for name, count, size in rows:
+        print(f"{name:<24}{count:>10}{size:>14,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens", type=int, default=2_000)
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    args = parser.parse_args()
+    run(args.tokens, args.tokens_per_second)
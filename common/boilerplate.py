@@ -0,0 +1,78 @@
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from urllib.parse import urlparse
+
+BOILERPLATE_SHARE = 0.5  # Lines on at least half of a site's pages are boilerplate
+MIN_PAGES = 3  # Below this many pages nothing is treated as boilerplate
+MAX_SITES = int(os.getenv("BOILERPLATE_MAX_SITES", 64))  # Site indexes kept, LRU
+SITE_TTL = float(os.getenv("BOILERPLATE_TTL", 3600))  # Seconds, then counted afresh
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_line(line):
+    return WHITESPACE.sub(" ", line).strip().lower()
+
+
+class BoilerplateIndex:
+    """
+    Counts on how many pages of a site each line appears. Header, navigation
+    and footer lines repeat on most pages and can then be stripped before the
+    text goes into a prompt.
+    """
+
+    def __init__(self, share=BOILERPLATE_SHARE, min_pages=MIN_PAGES):
+        self.share = share
+        self.min_pages = min_pages
+        self.pages = 0
+        self.line_pages = Counter()
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def add(self, text, key=None):
+        """Index a page once; key (e.g. the url) avoids counting a page twice."""
+        with self._lock:
+            if key is not None:
+                if key in self._seen:
+                    return
+                self._seen.add(key)
+            lines = {normalize_line(line) for line in text.split("\n")}
+            lines.discard("")
+            self.pages += 1
+            self.line_pages.update(lines)
+
+    def is_boilerplate(self, line):
+        if self.pages < self.min_pages:
+            return False
+        threshold = max(2, self.share * self.pages)
+        return self.line_pages[normalize_line(line)] >= threshold
+
+    def strip(self, text):
+        return "\n".join(
+            line for line in text.split("\n") if not self.is_boilerplate(line)
+        )
+
+
+_site_indexes = OrderedDict()  # host -> (created, BoilerplateIndex)
+_site_indexes_lock = threading.Lock()
+
+
+def site_index(url, max_sites=MAX_SITES, ttl=SITE_TTL):
+    """
+    Return: the shared BoilerplateIndex for the url's host. Indexes are kept
+    for the max_sites most recently used hosts, and a host's index is started
+    over after ttl seconds, so old page counts stop deciding what is boilerplate.
+    """
+    host = urlparse(url).netloc.lower()
+    now = time.monotonic()
+    with _site_indexes_lock:
+        entry = _site_indexes.get(host)
+        if entry is None or now - entry[0] >= ttl:
+            entry = _site_indexes[host] = (now, BoilerplateIndex())
+        _site_indexes.move_to_end(host)
+        while len(_site_indexes) > max_sites:
+            _site_indexes.popitem(last=False)
+        return entry[1]
@@ -0,0 +1,153 @@
+import math
+from functools import lru_cache
+
+from common.boilerplate import BoilerplateIndex, normalize_line
+
+# Tokens of page content sent per brochure request, by target model
+TOKEN_BUDGETS = {
+    "llama3.2": 2_000,
+    "gpt-4o-mini": 4_000,
+    "claude-3-haiku-20240307": 4_000,
+}
+DEFAULT_TOKEN_BUDGET = 1_250  # About the old 5,000 character cut-off
+MIN_PAGE_TOKENS = 150  # A page whose share would be smaller is not worth fetching
+CHARS_PER_TOKEN = 4  # Estimate used when tiktoken is not installed
+
+
+def token_budget(model):
+    return TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Close enough for Claude and local models
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model=None):
+    encoding = _encoding(model or "")
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def allocate(sizes, weights, budget):
+    """
+    Share budget across pages in proportion to their weights. Pages that need
+    less than their share keep what they need and the rest is shared again.
+    Return: tokens allowed per page
+    """
+    allowed = [0] * len(sizes)
+    active = [i for i, size in enumerate(sizes) if size > 0]
+    remaining = budget
+
+    while active and remaining > 0:
+        total_weight = sum(weights[i] for i in active)
+        share = {i: remaining * weights[i] / total_weight for i in active}
+        satisfied = [i for i in active if sizes[i] - allowed[i] <= share[i]]
+        if not satisfied:
+            for i in active:
+                allowed[i] += int(share[i])
+            break
+        for i in satisfied:
+            remaining -= sizes[i] - allowed[i]
+            allowed[i] = sizes[i]
+            active.remove(i)
+
+    return allowed
+
+
+class ContextPacker:
+    """
+    Packs page texts into a token budget. Site boilerplate (lines on most
+    pages) and lines already seen on an earlier page are dropped, and the
+    budget is shared across pages by weight instead of cutting off whatever
+    comes last.
+    """
+
+    def __init__(self, budget, model=None, index=None):
+        self.budget = budget
+        self.model = model
+        self.index = index or BoilerplateIndex()
+        self.pages = []
+        self._seen = set()
+
+    @property
+    def header_tokens(self):
+        return sum(count_tokens(header, self.model) for _, header, *_ in self.pages)
+
+    @property
+    def tokens(self):
+        return self.header_tokens + sum(sum(counts) for _, _, _, counts, _ in self.pages)
+
+    def next_share(self, weight=1.0):
+        """
+        Return: the tokens one more page of this weight would be allowed, if
+        it were long, once boilerplate is dropped and the budget is allocated
+        """
+        pages = list(self._without_boilerplate())
+        sizes = [sum(counts) for _, _, _, counts, _ in pages] + [self.budget]
+        weights = [weight for *_, weight in pages] + [weight]
+        return allocate(sizes, weights, self.budget - self.header_tokens)[-1]
+
+    @property
+    def full(self):
+        """True once another page would get less than MIN_PAGE_TOKENS."""
+        return self.next_share() < min(MIN_PAGE_TOKENS, self.budget)
+
+    def add(self, label, text, header="", weight=1.0, key=None):
+        self.index.add(text, key=key)
+        lines = []
+        for line in text.split("\n"):
+            normalized = normalize_line(line)
+            if not normalized or normalized in self._seen:
+                continue
+            self._seen.add(normalized)
+            lines.append(line)
+
+        counts = [count_tokens(line, self.model) + 1 for line in lines]
+        self.pages.append((label, header, lines, counts, weight))
+
+    def _without_boilerplate(self):
+        for label, header, lines, counts, weight in self.pages:
+            kept = [
+                (line, count)
+                for line, count in zip(lines, counts)
+                if not self.index.is_boilerplate(line)
+            ]
+            yield (
+                label,
+                header,
+                [line for line, _ in kept],
+                [count for _, count in kept],
+                weight,
+            )
+
+    def pack(self):
+        pages = list(self._without_boilerplate())
+        sizes = [sum(counts) for _, _, _, counts, _ in pages]
+        weights = [weight for *_, weight in pages]
+        allowed = allocate(sizes, weights, self.budget - self.header_tokens)
+
+        sections = []
+        for (label, header, lines, counts, _), limit in zip(pages, allowed):
+            kept, used = [], 0
+            for line, count in zip(lines, counts):
+                if used + count > limit:
+                    # Keep the start of a long line rather than dropping it
+                    if limit - used > 1:
+                        kept.append(line[: (limit - used - 1) * CHARS_PER_TOKEN])
+                    break
+                kept.append(line)
+                used += count
+            if kept:
+                sections.append(f"{label}\n{header}" + "\n".join(kept))
+
+        return "\n\n".join(sections) + "\n\n"
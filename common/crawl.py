@@ -0,0 +1,278 @@
+import asyncio
+import heapq
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from urllib.parse import urldefrag, urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+
+from common.fetch import MAX_PER_HOST
+from common.http_cache import http_cache
+from common.page_cache import normalize_url
+
+MAX_DEPTH = 2  # Hops from the landing page
+MAX_PAGES = 12  # Pages fetched per site to discover links
+MAX_CANDIDATES = 25  # Best ranked links offered to the model
+MIN_SCORE = -8  # Links ranked lower (legal, account, search pages) are dropped
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", 20))  # Seconds per site
+USER_AGENT = "Mozilla/5.0"
+
+SKIP_SCHEMES = ("mailto:", "tel:", "javascript:", "data:")
+SKIP_EXTENSIONS = re.compile(
+    r"\.(pdf|jpe?g|png|gif|svg|webp|ico|css|js|zip|gz|mp4|mp3|xml|json)$", re.I
+)
+
+# Path words of pages that belong in a brochure, and of pages that never do
+LINK_HINTS = {
+    "about": 5,
+    "company": 5,
+    "careers": 5,
+    "jobs": 5,
+    "team": 4,
+    "culture": 4,
+    "mission": 4,
+    "customers": 4,
+    "leadership": 3,
+    "values": 3,
+    "story": 3,
+    "press": 2,
+    "news": 2,
+    "product": 2,
+    "products": 2,
+    "solutions": 2,
+    "research": 2,
+    "blog": 1,
+    "contact": 1,
+}
+LINK_PENALTIES = {
+    "privacy": -10,
+    "terms": -10,
+    "legal": -10,
+    "cookie": -10,
+    "cookies": -10,
+    "login": -8,
+    "signin": -8,
+    "signup": -8,
+    "register": -8,
+    "cart": -8,
+    "search": -6,
+    "tag": -4,
+    "page": -2,
+}
+
+
+@dataclass
+class Candidate:
+    url: str
+    depth: int
+    score: int = 0
+    text: str = ""  # Anchor text of the first link to the url
+
+
+def link_key(url):
+    """Return: the normalized url links are deduplicated by, None if malformed"""
+    try:
+        return normalize_url(url)
+    except ValueError:  # e.g. a port that is not a number
+        return None
+
+
+def resolve_link(base_url, href):
+    """
+    Argument: the final url of the page (after redirects) and a raw href on it
+    Return: the absolute http(s) url without fragment, as it is to be fetched,
+    or None for in-page anchors, files, non-web schemes and malformed urls
+    """
+    href = href.strip()
+    if not href or href.startswith("#") or href.lower().startswith(SKIP_SCHEMES):
+        return None
+    try:
+        url = urldefrag(urljoin(base_url, href)).url
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    if parts.scheme not in ("http", "https") or SKIP_EXTENSIONS.search(parts.path):
+        return None
+    return url if link_key(url) else None
+
+
+def site_host(url):
+    host = (urlsplit(url).hostname or "").lower()
+    return host.removeprefix("www.")
+
+
+def link_score(url, depth=1):
+    """
+    Return: a cheap relevance guess for a brochure from the url alone; brochure
+    words in the path count, legal/account pages and deep paths count against
+    """
+    parts = urlsplit(url)
+    words = re.findall(r"[a-z]+", parts.path.lower())
+    score = sum(LINK_HINTS.get(word, 0) + LINK_PENALTIES.get(word, 0) for word in words)
+    segments = [segment for segment in parts.path.split("/") if segment]
+    return score - len(segments) - depth - (3 if parts.query else 0)
+
+
+class RobotsCache:
+    """robots.txt rules per host, fetched once through the HTTP cache."""
+
+    def __init__(self, user_agent=USER_AGENT):
+        self.user_agent = user_agent
+        self._parsers = {}
+        self._lock = threading.Lock()
+
+    def _parser(self, url):
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            if origin in self._parsers:
+                return self._parsers[origin]
+
+        parser = RobotFileParser()
+        try:
+            response = http_cache.get(f"{origin}/robots.txt")
+            if response.status_code == 200:
+                parser.parse(response.content.decode("utf-8", "replace").splitlines())
+            else:
+                parser.parse([])  # No robots.txt, everything is allowed
+        except Exception:
+            parser.parse([])
+        with self._lock:
+            self._parsers[origin] = parser
+        return parser
+
+    def allowed(self, url):
+        return self._parser(url).can_fetch(self.user_agent, url)
+
+
+robots = RobotsCache()
+
+
+async def crawl(
+    url,
+    get_page,
+    max_depth=MAX_DEPTH,
+    max_pages=MAX_PAGES,
+    timeout=CRAWL_TIMEOUT,
+    concurrency=MAX_PER_HOST,
+):
+    """
+    Crawl a site best-first from url. Links are resolved, deduplicated, kept to
+    the same site and to what robots.txt allows, and the most promising ones
+    are fetched first, up to max_depth hops and max_pages pages. The crawl
+    stops at the timeout with what it has found so far; fetches still running
+    then are abandoned, not waited for.
+    Argument: get_page(url) returns a page with .url (the final url after
+    redirects), .links and .anchors (blocking)
+    Return: a Candidate for every link found except the start page, best first;
+    urls are kept as found, they are only normalized to deduplicate them
+    """
+    loop = asyncio.get_running_loop()
+    # Own threads, so fetches left running at the timeout do not hold up the
+    # event loop's shutdown the way the default executor would
+    executor = ThreadPoolExecutor(concurrency, thread_name_prefix="crawl")
+
+    def blocking(function, *args):
+        return loop.run_in_executor(executor, function, *args)
+
+    root = normalize_url(url)
+    host = site_host(root)
+    landing = {root}  # Keys of the start page, also where it redirected to
+    found = {root: Candidate(url, 0)}  # Normalized url -> Candidate
+    frontier = [(0, 0, url)]  # (-score, depth, url)
+    fetched = 0
+    wakeup = asyncio.Condition()
+    active = 0
+
+    async def visit(page_url, depth):
+        nonlocal host
+        page = await blocking(get_page, page_url)
+        # Relative links resolve against where the page ended up
+        base = page.url or page_url
+        if depth == 0:
+            # The landing page may redirect, e.g. to https or another domain
+            host = site_host(base)
+            landing.add(link_key(base))
+        for href in page.links:
+            link = resolve_link(base, href)
+            if not link or site_host(link) != host:
+                continue
+            key = link_key(link)
+            if key in found or key in landing:
+                continue
+            if not await blocking(robots.allowed, link):
+                continue
+            candidate = Candidate(
+                link, depth + 1, link_score(link, depth + 1), page.anchors.get(href, "")
+            )
+            found[key] = candidate
+            # Links at the last hop are kept as candidates but not fetched
+            if candidate.depth < max_depth:
+                heapq.heappush(frontier, (-candidate.score, candidate.depth, link))
+
+    async def worker():
+        nonlocal fetched, active
+        while True:
+            async with wakeup:
+                # Wait while other workers may still add links to the frontier
+                while not frontier and active:
+                    await wakeup.wait()
+                if not frontier or fetched >= max_pages:
+                    wakeup.notify_all()
+                    return
+                _, depth, page_url = heapq.heappop(frontier)
+                fetched += 1
+                active += 1
+            try:
+                await visit(page_url, depth)
+            except Exception as e:
+                print(f"Crawl skipped {page_url}: {e}")
+            finally:
+                async with wakeup:
+                    active -= 1
+                    wakeup.notify_all()
+
+    try:
+        async with asyncio.timeout(timeout):
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+    except TimeoutError:
+        print(f"Crawl of {root} stopped after {timeout}s")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    del found[root]
+    return sorted(found.values(), key=lambda candidate: -candidate.score)
+
+
+def landing_candidates(page):
+    """Return: Candidates for the same-site links of an already fetched page"""
+    root = link_key(page.url)
+    host = site_host(page.url)
+    found = {}
+    for href in page.links:
+        link = resolve_link(page.url, href)
+        if not link or site_host(link) != host:
+            continue
+        key = link_key(link)
+        if key == root or key in found:
+            continue
+        if robots.allowed(link):
+            found[key] = Candidate(
+                link, 1, link_score(link), page.anchors.get(href, "")
+            )
+    return sorted(found.values(), key=lambda candidate: -candidate.score)
+
+
+def candidate_links(url, get_page, limit=MAX_CANDIDATES, landing=None, **crawl_options):
+    """
+    Return: the limit best ranked Candidates of the site, for link selection.
+    When the crawl finds nothing (e.g. it timed out on a slow site), the links
+    of the landing page, if given, are used instead.
+    Runs the crawl on its own event loop; call it from a thread, not a coroutine.
+    """
+    ranked = asyncio.run(crawl(url, get_page, **crawl_options))
+    if not ranked and landing is not None:
+        ranked = landing_candidates(landing)
+    return [candidate for candidate in ranked if candidate.score >= MIN_SCORE][:limit]
@@ -0,0 +1,255 @@
+import os
+import re
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+
+# "auto" picks the fastest installed backend: selectolax, then lxml, then stream
+EXTRACT_BACKEND = os.getenv("EXTRACT_BACKEND", "auto")
+
+# script/style are dropped from the text; img/input hold no text, template text
+# is skipped by BeautifulSoup's get_text as well
+SKIPPED_TAGS = {"script", "style", "template"}
+REMOVED_TAGS = ["script", "style", "img", "input"]
+
+CHARSET_PATTERN = re.compile(rb"<meta[^>]+charset=[\"']?([\w-]+)", re.IGNORECASE)
+# lxml and lexbor imply a <body> the markup never opened; BeautifulSoup does
+# not, and finds no body text on such a page
+BODY_PATTERN = re.compile(r"<body[\s/>]", re.IGNORECASE)
+COMMENT_PATTERN = re.compile(r"<!--.*?-->", re.DOTALL)
+
+
+@dataclass
+class ExtractedPage:
+    title: str | None
+    text: str
+    links: list = field(default_factory=list)
+    anchors: dict = field(default_factory=dict)  # href -> text of its first link
+
+
+def decode_html(content):
+    if isinstance(content, str):
+        return content
+    match = CHARSET_PATTERN.search(content[:4096])
+    encoding = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return content.decode(encoding, errors="replace")
+    except LookupError:
+        return content.decode("utf-8", errors="replace")
+
+
+def has_body(html):
+    """Return: True if the markup opens a <body> outside of comments"""
+    match = BODY_PATTERN.search(html)
+    if match and "<!--" in html[: match.start()]:
+        match = BODY_PATTERN.search(COMMENT_PATTERN.sub("", html))
+    return bool(match)
+
+
+class _PageCollector:
+    """
+    Collects title, visible body text and links from parser events in a single
+    pass, without building a tree. Text is split into strings at every tag, the
+    same way BeautifulSoup's get_text(separator="\\n", strip=True) sees it.
+    """
+
+    def __init__(self):
+        self.title_parts = None
+        self.in_title = False
+        self.in_body = False
+        self.skip_depth = 0
+        self.pending = []
+        self.text = []
+        self.links = []
+        self.anchors = {}
+        self.anchor = None  # (href, text parts) of the open link
+
+    def _flush(self):
+        if self.pending:
+            string = "".join(self.pending).strip()
+            if string:
+                self.text.append(string)
+            self.pending = []
+
+    def start(self, tag, attrs):
+        self._flush()
+        if tag == "title" and self.title_parts is None:
+            self.title_parts = []
+            self.in_title = True
+        elif tag == "body":
+            self.in_body = True
+        elif tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag == "a":
+            href = attrs.get("href")
+            if href:
+                self.links.append(href)
+                self.anchor = (href, [])
+
+    def end(self, tag):
+        self._flush()
+        if tag == "title":
+            self.in_title = False
+        elif tag == "body":
+            self.in_body = False
+        elif tag in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        elif tag == "a" and self.anchor:
+            href, parts = self.anchor
+            text = " ".join("".join(parts).split())
+            if text:
+                self.anchors.setdefault(href, text)
+            self.anchor = None
+
+    def data(self, data):
+        if self.in_title:
+            self.title_parts.append(data)
+        if self.skip_depth:
+            return
+        if self.in_body:
+            self.pending.append(data)
+        # Anchor text is kept wherever the link is, as BeautifulSoup does
+        if self.anchor:
+            self.anchor[1].append(data)
+
+    def comment(self, _):
+        self._flush()
+
+    def close(self):
+        self._flush()
+        title = "".join(self.title_parts) if self.title_parts else None
+        return ExtractedPage(
+            title or None, "\n".join(self.text), self.links, self.anchors
+        )
+
+
+class _StreamParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.collector = _PageCollector()
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+    def handle_comment(self, data):
+        self.collector.comment(data)
+
+    def handle_decl(self, decl):
+        self.collector.comment(decl)
+
+
+def extract_stream(content):
+    parser = _StreamParser()
+    parser.feed(decode_html(content))
+    parser.close()
+    return parser.collector.close()
+
+
+def extract_lxml(content):
+    from lxml import etree
+
+    html = decode_html(content)
+    # The target interface streams events straight into the collector
+    parser = etree.HTMLParser(target=_PageCollector())
+    parser.feed(html)
+    page = parser.close()
+    if not has_body(html):
+        page.text = ""
+    return page
+
+
+def extract_selectolax(content):
+    from selectolax.lexbor import LexborHTMLParser
+
+    html = decode_html(content)
+    tree = LexborHTMLParser(html)
+    title_node = tree.css_first("title")
+    title = title_node.text() if title_node else None
+    links = []
+    anchors = {}
+    for a in tree.css("a"):
+        href = a.attributes.get("href")
+        if href:
+            links.append(href)
+            text = " ".join(a.text(separator=" ").split())
+            if text:
+                anchors.setdefault(href, text)
+
+    text = ""
+    if tree.body and has_body(html):
+        tree.body.strip_tags(REMOVED_TAGS + ["template"])
+        text = tree.body.text(separator="\n", strip=True)
+        text = "\n".join(line for line in text.split("\n") if line)
+
+    return ExtractedPage(title or None, text, links, anchors)
+
+
+def extract_bs4(content):
+    # Reference implementation: the original BeautifulSoup path
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, "html.parser")
+    title = soup.title.string if soup.title else None
+    if soup.body:
+        for irrelevant in soup.body(REMOVED_TAGS):
+            irrelevant.decompose()
+        text = soup.body.get_text(separator="\n", strip=True)
+    else:
+        text = ""
+    links = []
+    anchors = {}
+    for link in soup.find_all("a"):
+        href = link.get("href")
+        if href:
+            links.append(href)
+            anchor = " ".join(link.get_text(" ").split())
+            if anchor:
+                anchors.setdefault(href, anchor)
+
+    return ExtractedPage(title, text, links, anchors)
+
+
+BACKENDS = {
+    "selectolax": extract_selectolax,
+    "lxml": extract_lxml,
+    "stream": extract_stream,
+    "bs4": extract_bs4,
+}
+
+
+def available_backends():
+    available = []
+    for name, module in [
+        ("selectolax", "selectolax"),
+        ("lxml", "lxml"),
+        ("stream", None),
+        ("bs4", "bs4"),
+    ]:
+        if module:
+            try:
+                __import__(module)
+            except ImportError:
+                continue
+        available.append(name)
+    return available
+
+
+def get_extractor(backend=EXTRACT_BACKEND):
+    if backend == "auto":
+        backend = available_backends()[0]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown extract backend: {backend}")
+    return BACKENDS[backend]
+
+
+def extract(content, backend=EXTRACT_BACKEND):
+    """
+    Argument: raw html (bytes or str)
+    Return: ExtractedPage with title, visible body text and links
+    """
+    return get_extractor(backend)(content)
@@ -0,0 +1,199 @@
+import re
+import sqlite3
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+
+
+def normalize_city(name):
+    """
+    Argument: a city name as typed
+    Return: lower case ascii letters and digits only, "Tirupati " -> "tirupati"
+    """
+    name = unicodedata.normalize("NFKD", name or "")
+    name = name.encode("ascii", "ignore").decode().lower()
+    return re.sub(r"[^a-z0-9]", "", name)
+
+
+def city_key(name):
+    """
+    Return: the normalized name with the spelling variants of transliterated
+    names folded together: an "h" after a consonant and doubled letters are
+    dropped, so "Vrindavan" and "vrindhavan" share a key
+    """
+    key = re.sub(r"(?<=[bcdgjkpt])h", "", normalize_city(name))
+    return re.sub(r"(.)\1+", r"\1", key)
+
+
+def deletions(key):
+    return {key[:i] + key[i + 1 :] for i in range(len(key))}
+
+
+class CityIndex:
+    """
+    City names and aliases, looked up by exact name, then by key, then by one
+    typo (a precomputed single-deletion index), then by a unique prefix (bisect
+    over the sorted keys). Each lookup is a handful of dict probes or O(log n).
+    Cities that fold to the same key ("Bhopal", "Bopal") are only told apart by
+    their exact names; the shared key alone is ambiguous.
+    """
+
+    def __init__(self):
+        self._exact = defaultdict(set)  # normalized name -> cities
+        self._names = defaultdict(set)  # key -> cities
+        self._deleted = defaultdict(set)  # key with one letter removed -> keys
+        self._sorted = []
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def add(self, city, aliases=()):
+        with self._lock:
+            for name in (city, *aliases):
+                key = city_key(name)
+                if not key:
+                    continue
+                self._exact[normalize_city(name)].add(city)
+                if key not in self._names:
+                    for deleted in deletions(key):
+                        self._deleted[deleted].add(key)
+                    self._dirty = True
+                self._names[key].add(city)
+
+    def _prefix(self, key):
+        with self._lock:
+            if self._dirty:
+                self._sorted = sorted(self._names)
+                self._dirty = False
+            keys = self._sorted
+        start = bisect_left(keys, key)
+        end = bisect_left(keys, key + "\x7f", start)
+        matches = set().union(*(self._names[k] for k in keys[start:end]))
+        return matches.pop() if len(matches) == 1 else None
+
+    def resolve(self, name):
+        """Return: the city the name refers to, or None when unknown or ambiguous"""
+        key = city_key(name)
+        if not key:
+            return None
+        exact = self._exact.get(normalize_city(name), ())
+        if len(exact) == 1:
+            return next(iter(exact))
+        if key in self._names:
+            cities = self._names[key]
+            return next(iter(cities)) if len(cities) == 1 else None
+
+        # One letter missing, extra, or wrong: the key and a stored key share a
+        # one-deletion variant
+        candidates = set(self._deleted.get(key, ()))
+        for deleted in deletions(key):
+            if deleted in self._names:
+                candidates.add(deleted)
+            candidates |= self._deleted.get(deleted, set())
+        cities = set().union(*(self._names[candidate] for candidate in candidates))
+        if len(cities) == 1:
+            return cities.pop()
+        if cities:
+            return None
+
+        return self._prefix(key) if len(key) >= 3 else None
+
+
+class FareStore:
+    """Fares by (city, origin, date) in memory, city names go through a CityIndex."""
+
+    def __init__(self):
+        self.cities = CityIndex()
+        self._fares = {}
+
+    def add_many(self, rows):
+        """Argument: (city, price, origin, date) rows"""
+        for city, price, origin, date in rows:
+            self.cities.add(city)
+            self._fares[city, origin, date] = price
+
+    def add(self, city, price, origin="", date=""):
+        self.add_many([(city, price, origin, date)])
+
+    def add_aliases(self, city, aliases):
+        self.cities.add(city, aliases)
+
+    def price(self, city, origin="", date=""):
+        """Return: the fare, or None when the city or route is unknown"""
+        resolved = self.cities.resolve(city)
+        if resolved is None:
+            return None
+        return self._fares.get((resolved, origin, date))
+
+
+class SqliteFareStore(FareStore):
+    """
+    Fares kept in a SQLite table, for fare sheets too large for memory. City
+    names and aliases are loaded into the in-memory CityIndex on open; fares
+    are read through the (city, origin, date) primary key.
+    """
+
+    def __init__(self, path):
+        self.cities = CityIndex()
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        db = self._connect()
+        with db:
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS fares (
+                    city TEXT,
+                    origin TEXT,
+                    date TEXT,
+                    price TEXT,
+                    PRIMARY KEY (city, origin, date)
+                )
+                """
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, city TEXT)"
+            )
+        for (city,) in db.execute("SELECT DISTINCT city FROM fares"):
+            self.cities.add(city)
+        for alias, city in db.execute("SELECT alias, city FROM aliases"):
+            self.cities.add(city, [alias])
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads, keep one each
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30)
+        return db
+
+    def add_many(self, rows):
+        rows = [(city, origin, date, price) for city, price, origin, date in rows]
+        db = self._connect()
+        with db:
+            db.executemany("INSERT OR REPLACE INTO fares VALUES (?, ?, ?, ?)", rows)
+        for city in {row[0] for row in rows}:
+            self.cities.add(city)
+
+    def add_aliases(self, city, aliases):
+        db = self._connect()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO aliases VALUES (?, ?)",
+                [(alias, city) for alias in aliases],
+            )
+        self.cities.add(city, aliases)
+
+    def price(self, city, origin="", date=""):
+        resolved = self.cities.resolve(city)
+        if resolved is None:
+            return None
+        row = (
+            self._connect()
+            .execute(
+                "SELECT price FROM fares WHERE city = ? AND origin = ? AND date = ?",
+                (resolved, origin, date),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
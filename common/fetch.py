@@ -0,0 +1,151 @@
+import importlib.util
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+MAX_WORKERS = 8  # Pages fetched at the same time across all hosts
+MAX_PER_HOST = 4  # Pages fetched at the same time from a single host
+POOL_HOSTS = 32  # Hosts that keep a pool of keep-alive connections
+POOL_PER_HOST = int(os.getenv("FETCH_POOL_PER_HOST", 10))  # Keep-alive connections per host
+
+CONNECT_TIMEOUT = float(os.getenv("FETCH_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("FETCH_READ_TIMEOUT", 10))
+REQUEST_TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", 3))
+BACKOFF_FACTOR = 0.5  # Waits 0.5s, 1s, 2s, ... between attempts
+MAX_BACKOFF = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Only these are retried unless asked; a retried POST may run the work again
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# HTTP/2 needs httpx with the h2 extra installed, otherwise requests is used
+USE_HTTP2 = os.getenv("FETCH_HTTP2", "").lower() in ("1", "true", "yes")
+
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+_client = None
+_client_lock = threading.Lock()
+
+
+def _requests_client():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_PER_HOST)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session, (requests.ConnectionError, requests.Timeout)
+
+
+def _httpx_client():
+    import httpx
+
+    client = httpx.Client(
+        http2=True,
+        follow_redirects=True,
+        limits=httpx.Limits(
+            max_connections=POOL_HOSTS * POOL_PER_HOST,
+            max_keepalive_connections=POOL_HOSTS * POOL_PER_HOST,
+        ),
+    )
+    return client, (httpx.TransportError,)
+
+
+def get_client():
+    """
+    Return: the shared (client, retryable_errors) pair. One client per process
+    so connections and TLS sessions are reused across every page and module.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            if USE_HTTP2:
+                if importlib.util.find_spec("h2") and importlib.util.find_spec("httpx"):
+                    _client = _httpx_client()
+                else:
+                    print("HTTP/2 needs `pip install httpx[http2]`, using HTTP/1.1")
+            if _client is None:
+                _client = _requests_client()
+        return _client
+
+
+def _backoff(attempt, response=None):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), MAX_BACKOFF)
+    delay = BACKOFF_FACTOR * 2**attempt
+    return min(delay + random.uniform(0, delay / 2), MAX_BACKOFF)
+
+
+def request(method, url, timeout=REQUEST_TIMEOUT, retries=None, **kwargs):
+    """
+    Send a request on the shared pooled client.
+    Connection errors, timeouts and 429/5xx responses are retried with
+    exponential backoff; the last response or error is returned/raised.
+    By default only idempotent methods are retried, POST is sent once.
+    """
+    if retries is None:
+        retries = MAX_RETRIES if method.upper() in IDEMPOTENT_METHODS else 0
+    client, retryable_errors = get_client()
+    if not isinstance(timeout, tuple):
+        timeout = (CONNECT_TIMEOUT, timeout)
+    if not isinstance(client, requests.Session):
+        import httpx
+
+        timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+
+    for attempt in range(retries + 1):
+        try:
+            response = client.request(method, url, timeout=timeout, **kwargs)
+        except retryable_errors:
+            if attempt == retries:
+                raise
+            time.sleep(_backoff(attempt))
+            continue
+
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            return response
+        time.sleep(_backoff(attempt, response))
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def _host_limit(url):
+    host = urlparse(url).netloc.lower()
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(MAX_PER_HOST)
+        return _host_limits[host]
+
+
+def _fetch_one(fetch, url):
+    with _host_limit(url):
+        try:
+            return fetch(url)
+        except Exception as e:
+            print(f"Failed to fetch {url}: {e}")
+            return None
+
+
+def fetch_all(urls, fetch, max_workers=MAX_WORKERS):
+    """
+    Call fetch(url) for every url on a thread pool.
+    Return: results in the same order as urls, None where a fetch failed
+    """
+    urls = list(urls)
+    if not urls:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        return list(executor.map(lambda url: _fetch_one(fetch, url), urls))
@@ -0,0 +1,118 @@
+import os
+import threading
+from collections import OrderedDict
+
+from common.context import count_tokens
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 3_000))
+KEEP_RECENT_TURNS = 4  # Turns that are always sent verbatim
+MAX_SESSIONS = 1_000
+
+SUMMARY_PROMPT = "You keep a running summary of a conversation between a user and an assistant. \
+Update the summary with the new turns below. Keep names, numbers, decisions and open questions. \
+Reply with the updated summary only, in at most 200 words."
+
+
+def summary_messages(summary, turns):
+    """
+    Argument: the current summary and the turns that are being dropped
+    Return: messages asking a model to fold those turns into the summary
+    """
+    transcript = "\n".join(
+        f"User: {user}\nAssistant: {assistant}" for user, assistant, _ in turns
+    )
+    content = f"Current summary:\n{summary or '(empty)'}\n\nNew turns:\n{transcript}"
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": content},
+    ]
+
+
+class ChatHistory:
+    """
+    The history of one chat session, kept within a token budget. Recent turns
+    stay verbatim; older turns are folded into a rolling summary. Every turn is
+    tokenized once, when it is first seen.
+    """
+
+    def __init__(self, budget=HISTORY_TOKEN_BUDGET, model=None):
+        self.budget = budget
+        self.model = model
+        self.reset()
+
+    def reset(self):
+        self.summary = ""
+        self.summary_tokens = 0
+        self.turns = []  # (user, assistant, tokens)
+        self.seen = 0  # Turns of the UI history already taken in
+        self.last_user = None
+
+    @property
+    def tokens(self):
+        return self.summary_tokens + sum(tokens for *_, tokens in self.turns)
+
+    def sync(self, history):
+        """Take in the turns of the UI history that are new since the last call."""
+        if len(history) < self.seen or (
+            self.seen and history[self.seen - 1][0] != self.last_user
+        ):
+            # The conversation was edited or cleared, start over
+            self.reset()
+
+        for user, assistant in history[self.seen :]:
+            self.add_turn(user, assistant)
+
+    def add_turn(self, user, assistant):
+        tokens = count_tokens(f"{user}\n{assistant}", self.model)
+        self.turns.append((user, assistant, tokens))
+        self.last_user = user
+        self.seen += 1
+
+    def to_compact(self):
+        """Return: the oldest turns that have to leave the verbatim window"""
+        dropped = 0
+        excess = self.tokens - self.budget
+        while excess > 0 and len(self.turns) - dropped > KEEP_RECENT_TURNS:
+            excess -= self.turns[dropped][2]
+            dropped += 1
+        return self.turns[:dropped]
+
+    def compacted(self, turns, summary):
+        """Replace the given oldest turns with the updated rolling summary."""
+        self.turns = self.turns[len(turns) :]
+        self.summary = summary
+        self.summary_tokens = count_tokens(summary, self.model)
+
+    def messages(self, system_message, message):
+        messages = [{"role": "system", "content": system_message}]
+        if self.summary:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation:\n{self.summary}",
+                }
+            )
+        for user, assistant, _ in self.turns:
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        messages.append({"role": "user", "content": message})
+        return messages
+
+
+class HistoryStore:
+    """ChatHistory per session id, least recently used sessions are dropped."""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, **history_options):
+        self.max_sessions = max_sessions
+        self.history_options = history_options
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            if session_id not in self._sessions:
+                self._sessions[session_id] = ChatHistory(**self.history_options)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return self._sessions[session_id]
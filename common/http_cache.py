@@ -0,0 +1,179 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from common import fetch
+from common.fetch import REQUEST_TIMEOUT
+from common.page_cache import normalize_url
+
+CACHE_PATH = Path(__file__).resolve().parent.parent / ".cache" / "http_cache.sqlite"
+DEFAULT_MAX_AGE = 3600  # Seconds a response is fresh when the server does not say
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    content: bytes
+    headers: dict = field(default_factory=dict)
+    from_cache: bool = False
+    url: str = ""  # Final url after redirects, the base for relative links
+
+
+def _freshness(headers, default_max_age):
+    """
+    Argument: response headers
+    Return: seconds the response stays fresh, or None if it must not be stored
+    """
+    cache_control = headers.get("Cache-Control", "").lower()
+    directives = [d.strip() for d in cache_control.split(",") if d.strip()]
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    for directive in directives:
+        if directive.startswith("max-age="):
+            try:
+                return int(directive.split("=", 1)[1])
+            except ValueError:
+                break
+    return default_max_age
+
+
+class HttpCache:
+    """
+    Disk-backed GET cache. Fresh entries are answered locally, stale entries
+    are revalidated with If-None-Match / If-Modified-Since.
+    """
+
+    def __init__(self, path=CACHE_PATH, default_max_age=DEFAULT_MAX_AGE):
+        self.path = Path(path)
+        self.default_max_age = default_max_age
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    status_code INTEGER,
+                    headers TEXT,
+                    body BLOB,
+                    etag TEXT,
+                    last_modified TEXT,
+                    stored_at REAL,
+                    max_age REAL,
+                    final_url TEXT
+                )
+                """
+            )
+            columns = {row[1] for row in db.execute("PRAGMA table_info(responses)")}
+            if "final_url" not in columns:  # Cache files from before redirects
+                db.execute("ALTER TABLE responses ADD COLUMN final_url TEXT")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _load(self, key):
+        with self._connect() as db:
+            return db.execute(
+                "SELECT status_code, headers, body, etag, last_modified, stored_at, "
+                "max_age, final_url FROM responses WHERE url = ?",
+                (key,),
+            ).fetchone()
+
+    def _store(self, key, response, max_age):
+        # Validators are read from the case-insensitive headers; the plain dict
+        # keeps whatever case the server (or HTTP/2, always lower) sent
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        headers = dict(response.headers)
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    response.status_code,
+                    json.dumps(headers),
+                    response.content,
+                    etag,
+                    last_modified,
+                    time.time(),
+                    max_age,
+                    str(response.url),
+                ),
+            )
+
+    def _touch(self, key, max_age):
+        with self._connect() as db:
+            db.execute(
+                "UPDATE responses SET stored_at = ?, max_age = ? WHERE url = ?",
+                (time.time(), max_age, key),
+            )
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, url, headers=None, timeout=REQUEST_TIMEOUT):
+        key = normalize_url(url)
+        request_headers = dict(headers or {})
+        row = self._load(key)
+
+        if row:
+            (
+                status_code,
+                stored_headers,
+                body,
+                etag,
+                last_modified,
+                stored_at,
+                max_age,
+                final_url,
+            ) = row
+            final_url = final_url or url
+            stored_headers = json.loads(stored_headers)
+            if time.time() - stored_at < max_age:
+                self._count("hits")
+                return CachedResponse(
+                    status_code, body, stored_headers, True, final_url
+                )
+            if etag:
+                request_headers["If-None-Match"] = etag
+            if last_modified:
+                request_headers["If-Modified-Since"] = last_modified
+
+        response = fetch.get(url, headers=request_headers, timeout=timeout)
+
+        if row and response.status_code == 304:
+            self._count("revalidated")
+            max_age = _freshness(response.headers, self.default_max_age)
+            self._touch(key, max_age or 0)
+            return CachedResponse(status_code, body, stored_headers, True, final_url)
+
+        self._count("misses")
+        max_age = _freshness(response.headers, self.default_max_age)
+        if response.status_code == 200 and max_age is not None:
+            self._store(key, response, max_age)
+
+        return CachedResponse(
+            response.status_code,
+            response.content,
+            dict(response.headers),
+            url=str(response.url),
+        )
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+        }
+
+
+http_cache = HttpCache()
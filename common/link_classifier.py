@@ -0,0 +1,135 @@
+import importlib.util
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+# Optional: also compare links to the link types with a small local embedding
+# model, needs `pip install sentence-transformers` and runs on the CPU
+USE_EMBEDDINGS = os.getenv("LINK_EMBEDDINGS", "").lower() in ("1", "true", "yes")
+EMBEDDING_MODEL = os.getenv("LINK_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+LINK_THRESHOLD = 0.5  # Lowest score of a link that is returned
+CONFIDENT_SCORE = 0.8  # Links scoring this high are taken without asking a model
+MIN_CONFIDENT_LINKS = 2  # Confident links needed to skip the model
+MAX_LINKS_PER_TYPE = 2
+
+# Link type -> (path words, anchor text phrases, description for embeddings)
+LINK_TYPES = {
+    "about page": (
+        {"about", "company", "who-we-are", "our-story", "mission", "about-us"},
+        {"about", "about us", "company", "who we are", "our story", "mission"},
+        "About the company: who we are, our mission and our story",
+    ),
+    "careers page": (
+        {"careers", "career", "jobs", "join-us", "work-with-us", "hiring"},
+        {"careers", "jobs", "join us", "work with us", "we're hiring", "open roles"},
+        "Careers: open jobs and working at the company",
+    ),
+    "customers page": (
+        {"customers", "clients", "case-studies", "customer-stories"},
+        {"customers", "clients", "case studies", "customer stories"},
+        "Customers: case studies and the companies using our products",
+    ),
+    "team page": (
+        {"team", "leadership", "people", "founders"},
+        {"team", "our team", "leadership", "people", "founders"},
+        "The team and leadership of the company",
+    ),
+    "news page": (
+        {"news", "press", "newsroom", "media"},
+        {"news", "press", "newsroom", "media"},
+        "Company news and press releases",
+    ),
+    "products page": (
+        {"products", "product", "solutions", "platform", "services"},
+        {"products", "product", "solutions", "platform", "services"},
+        "The products and services the company sells",
+    ),
+}
+
+
+def rule_score(url, text, path_words, phrases):
+    """
+    Return: 0..1 from the url path and the anchor text. The last path segment
+    counts most, so /careers outranks the job postings below it.
+    """
+    path = urlsplit(url).path.lower()
+    segments = [segment for segment in path.split("/") if segment]
+    score = 0.0
+    if segments and segments[-1] in path_words:
+        score += 0.6
+    elif any(segment in path_words for segment in segments):
+        score += 0.3
+
+    text = " ".join(re.findall(r"[a-z']+", text.lower()))
+    if text in phrases:
+        score += 0.4
+    elif any(phrase in text for phrase in phrases):
+        score += 0.2
+    return min(score, 1.0)
+
+
+@lru_cache(maxsize=1)
+def _embedder():
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    descriptions = [description for *_, description in LINK_TYPES.values()]
+    return model, model.encode(descriptions, normalize_embeddings=True)
+
+
+def embeddings_available():
+    return USE_EMBEDDINGS and importlib.util.find_spec("sentence_transformers")
+
+
+def embedding_scores(candidates):
+    """Return: per candidate, the cosine similarity to each link type"""
+    model, types = _embedder()
+    labels = [
+        f"{candidate.text} {' '.join(re.findall(r'[a-z]+', candidate.url.lower()))}"
+        for candidate in candidates
+    ]
+    links = model.encode(labels, normalize_embeddings=True)
+    return (links @ types.T).tolist()
+
+
+def classify_links(candidates):
+    """
+    Argument: Candidates with .url and .text (anchor text), best ranked first
+    Return: ({"links": [{"type", "url"}]}, confident), the same shape a model
+    returns; confident is False when the result should be checked by a model
+    """
+    scores = [
+        {
+            link_type: rule_score(candidate.url, candidate.text, path_words, phrases)
+            for link_type, (path_words, phrases, _) in LINK_TYPES.items()
+        }
+        for candidate in candidates
+    ]
+
+    unsure = [i for i, row in enumerate(scores) if max(row.values()) < CONFIDENT_SCORE]
+    if unsure and embeddings_available():
+        similarities = embedding_scores([candidates[i] for i in unsure])
+        for i, row in zip(unsure, similarities):
+            for link_type, similarity in zip(LINK_TYPES, row):
+                scores[i][link_type] = max(scores[i][link_type], similarity)
+
+    # Every link gets its best type, and each type keeps its best few links
+    best = []
+    for candidate, row in zip(candidates, scores):
+        link_type = max(row, key=row.get)
+        if row[link_type] >= LINK_THRESHOLD:
+            best.append((row[link_type], link_type, candidate.url))
+    best.sort(key=lambda item: -item[0])
+
+    links = []
+    confident = 0
+    per_type = Counter()
+    for score, link_type, url in best:
+        if per_type[link_type] < MAX_LINKS_PER_TYPE:
+            per_type[link_type] += 1
+            confident += score >= CONFIDENT_SCORE
+            links.append({"type": link_type, "url": url})
+    return {"links": links}, confident >= MIN_CONFIDENT_LINKS
@@ -0,0 +1,512 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from common.llm_cache import llm_cache
+from common.prompt_cache import KEEP_ALIVE, cached_system, prompt_tokens
+from common.providers import (
+    MAX_CONNECTIONS,
+    async_claude,
+    async_ollama,
+    async_openai,
+    gemini,
+    sync_claude,
+    sync_ollama,
+    sync_openai,
+)
+
+DEFAULT_MAX_TOKENS = 1000  # Anthropic needs a limit on every request
+METRICS_LOG = os.getenv("LLM_METRICS_LOG")  # Optional JSONL file, a line per call
+
+# Requests in flight per provider; calls beyond this wait and count as queue
+# time. Ollama calls are only capped when OLLAMA_NUM_PARALLEL is set; otherwise
+# the caller's own worker settings (e.g. --inference-workers) decide.
+_ollama_parallel = os.getenv("OLLAMA_NUM_PARALLEL")
+PROVIDER_SLOTS = {
+    "openai": MAX_CONNECTIONS,
+    "anthropic": MAX_CONNECTIONS,
+    "gemini": MAX_CONNECTIONS,
+    "ollama": int(_ollama_parallel) if _ollama_parallel else None,
+}
+
+
+@dataclass
+class CallMetrics:
+    provider: str
+    model: str
+    site: str
+    streamed: bool
+    queue_time: float = 0.0  # Seconds waiting for a free slot of the provider
+    ttft: float = 0.0  # Seconds from sending the request to the first token
+    duration: float = 0.0  # Seconds from sending the request to the last token
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0  # Prompt tokens read from the provider's prompt cache
+    cache_hit: bool = True  # Answered from the LLM cache, nothing was sent
+    error: str = ""
+
+    @property
+    def generation_time(self):
+        # Streamed tokens are generated after the first one arrives
+        return self.duration - self.ttft if self.streamed else self.duration
+
+    @property
+    def tokens_per_second(self):
+        generating = self.generation_time
+        return self.completion_tokens / generating if generating > 0 else 0.0
+
+
+def _mean(total, count, digits=3):
+    return round(total / count, digits) if count else 0.0
+
+
+class MetricsLog:
+    """
+    Metrics of every model call, summed per call site and optionally appended
+    to a JSONL file for later analysis.
+    """
+
+    def __init__(self, path=METRICS_LOG):
+        self.path = Path(path) if path else None
+        self._sites = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+    def record(self, metrics):
+        with self._lock:
+            totals = self._sites[metrics.site]
+            totals["calls"] += 1
+            totals["cache_hits"] += metrics.cache_hit
+            totals["errors"] += bool(metrics.error)
+            if not metrics.cache_hit:
+                totals["sent"] += 1
+                totals["queue_time"] += metrics.queue_time
+                totals["ttft"] += metrics.ttft
+                totals["prompt"] += metrics.prompt_tokens
+                totals["completion"] += metrics.completion_tokens
+                totals["cached"] += metrics.cached_tokens
+                totals["generating"] += metrics.generation_time
+            if self.path:
+                line = asdict(metrics)
+                line["tokens_per_second"] = metrics.tokens_per_second
+                with self.path.open("a", encoding="utf-8") as log:
+                    log.write(json.dumps(line) + "\n")
+
+    def report(self):
+        """
+        Return: per call site the calls, LLM cache hits and errors, the mean
+        queue time and time to first token of the calls sent, tokens per
+        second, and the prompt, completion and provider-cached tokens
+        """
+        with self._lock:
+            sites = {site: totals.copy() for site, totals in self._sites.items()}
+        return {
+            site: {
+                "calls": int(totals["calls"]),
+                "cache_hits": int(totals["cache_hits"]),
+                "errors": int(totals["errors"]),
+                "queue_time": _mean(totals["queue_time"], totals["sent"]),
+                "ttft": _mean(totals["ttft"], totals["sent"]),
+                "tokens_per_second": _mean(
+                    totals["completion"], totals["generating"], 1
+                ),
+                "prompt": int(totals["prompt"]),
+                "completion": int(totals["completion"]),
+                "cached": int(totals["cached"]),
+                "prompt_cache_hit_rate": _mean(totals["cached"], totals["prompt"]),
+            }
+            for site, totals in sites.items()
+        }
+
+
+metrics = MetricsLog()
+
+_slots = {}
+_slots_lock = threading.Lock()
+_async_slots = weakref.WeakKeyDictionary()  # event loop -> provider -> Semaphore
+
+
+def _slot(provider):
+    if PROVIDER_SLOTS[provider] is None:
+        return None
+    with _slots_lock:
+        if provider not in _slots:
+            _slots[provider] = threading.BoundedSemaphore(PROVIDER_SLOTS[provider])
+        return _slots[provider]
+
+
+def _async_slot(provider):
+    if PROVIDER_SLOTS[provider] is None:
+        return None
+    # asyncio semaphores belong to one event loop, keep a set per loop
+    with _slots_lock:
+        slots = _async_slots.setdefault(asyncio.get_running_loop(), {})
+        if provider not in slots:
+            slots[provider] = asyncio.Semaphore(PROVIDER_SLOTS[provider])
+        return slots[provider]
+
+
+class ModelCall:
+    """
+    Times one model call and records its metrics when the call ends. Use it as
+    a (async) context manager around the call; send() / asend() wait for a slot
+    of the provider, when it is capped, just before the request goes out, and
+    token() marks every token or delta received. A call that never sends was a
+    cache hit.
+    """
+
+    def __init__(self, provider, model, site=None, streamed=False):
+        self.metrics = CallMetrics(provider, model, site or provider, streamed)
+        self._created = time.perf_counter()
+        self._sent = None
+        self._first_token = None
+        self._release = None
+        self._done = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(exc)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.finish(exc)
+
+    def _mark_sent(self):
+        self._sent = time.perf_counter()
+        self.metrics.queue_time = self._sent - self._created
+        self.metrics.cache_hit = False
+
+    def send(self):
+        slot = _slot(self.metrics.provider)
+        if slot:
+            slot.acquire()
+            self._release = slot.release
+        self._mark_sent()
+
+    async def asend(self):
+        slot = _async_slot(self.metrics.provider)
+        if slot:
+            await slot.acquire()
+            self._release = slot.release
+        self._mark_sent()
+
+    def token(self):
+        if self._first_token is None and self._sent is not None:
+            self._first_token = time.perf_counter()
+
+    def usage(self, prompt=0, completion=0, cached=0):
+        self.metrics.prompt_tokens = prompt
+        self.metrics.completion_tokens = completion
+        self.metrics.cached_tokens = cached
+
+    def finish(self, error=None):
+        if self._done:
+            return
+        self._done = True
+        if self._release:
+            self._release()
+        if self._sent is not None:
+            end = time.perf_counter()
+            self.metrics.duration = end - self._sent
+            self.metrics.ttft = (self._first_token or end) - self._sent
+        if isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+            self.metrics.error = "cancelled"
+        elif error is not None:
+            self.metrics.error = f"{type(error).__name__}: {error}"
+        metrics.record(self.metrics)
+
+
+def openai_usage(usage):
+    """Return: (prompt, completion, cached) tokens of an OpenAI usage"""
+    prompt, cached = prompt_tokens(usage)
+    return prompt, usage.completion_tokens, cached
+
+
+def claude_usage(usage):
+    prompt, cached = prompt_tokens(usage)
+    return prompt, usage.output_tokens, cached
+
+
+def gemini_usage(usage):
+    return (
+        usage.prompt_token_count or 0,
+        usage.candidates_token_count or 0,
+        usage.cached_content_token_count or 0,
+    )
+
+
+def ollama_usage(response):
+    return response.prompt_eval_count or 0, response.eval_count or 0, 0
+
+
+def split_system(messages):
+    """Return: (the system messages joined, the other messages)"""
+    system = [m["content"] for m in messages if m["role"] == "system"]
+    return "\n\n".join(system), [m for m in messages if m["role"] != "system"]
+
+
+class OpenAIChat:
+    """OpenAI takes the messages as they are."""
+
+    def request(self, model, messages, options):
+        return {"model": model, "messages": messages, **options}
+
+    def create(self, params, call):
+        response = sync_openai().chat.completions.create(**params)
+        call.usage(*openai_usage(response.usage))
+        return response.choices[0].message.content
+
+    async def acreate(self, params, call):
+        response = await async_openai().chat.completions.create(**params)
+        call.usage(*openai_usage(response.usage))
+        return response.choices[0].message.content
+
+    def stream(self, params, call):
+        with sync_openai().chat.completions.create(
+            **params, stream=True, stream_options={"include_usage": True}
+        ) as response:
+            for chunk in response:
+                # The usage arrives in a last chunk without choices
+                if chunk.usage:
+                    call.usage(*openai_usage(chunk.usage))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    async def astream(self, params, call):
+        response = await async_openai().chat.completions.create(
+            **params, stream=True, stream_options={"include_usage": True}
+        )
+        async with response:
+            async for chunk in response:
+                if chunk.usage:
+                    call.usage(*openai_usage(chunk.usage))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+
+class ClaudeChat:
+    """Anthropic takes the system prompt apart, with a prompt cache breakpoint."""
+
+    def request(self, model, messages, options):
+        system, messages = split_system(messages)
+        params = {"model": model, "messages": messages}
+        if system:
+            params["system"] = cached_system(system)
+        return {"max_tokens": DEFAULT_MAX_TOKENS, **params, **options}
+
+    def create(self, params, call):
+        response = sync_claude().messages.create(**params)
+        call.usage(*claude_usage(response.usage))
+        return response.content[0].text
+
+    async def acreate(self, params, call):
+        response = await async_claude().messages.create(**params)
+        call.usage(*claude_usage(response.usage))
+        return response.content[0].text
+
+    def stream(self, params, call):
+        with sync_claude().messages.stream(**params) as response:
+            yield from response.text_stream
+            call.usage(*claude_usage(response.get_final_message().usage))
+
+    async def astream(self, params, call):
+        async with async_claude().messages.stream(**params) as response:
+            async for text in response.text_stream:
+                yield text
+            message = await response.get_final_message()
+        call.usage(*claude_usage(message.usage))
+
+
+class GeminiChat:
+    """Gemini takes "model" turns of text parts and the system prompt in config."""
+
+    def request(self, model, messages, options):
+        system, messages = split_system(messages)
+        contents = [
+            {
+                "role": "model" if m["role"] == "assistant" else "user",
+                "parts": [{"text": m["content"]}],
+            }
+            for m in messages
+        ]
+        config = dict(options)
+        if "max_tokens" in config:
+            config["max_output_tokens"] = config.pop("max_tokens")
+        if system:
+            config["system_instruction"] = system
+        return {"model": model, "contents": contents, "config": config}
+
+    def create(self, params, call):
+        response = gemini().models.generate_content(**params)
+        if response.usage_metadata:
+            call.usage(*gemini_usage(response.usage_metadata))
+        return response.text
+
+    async def acreate(self, params, call):
+        response = await gemini().aio.models.generate_content(**params)
+        if response.usage_metadata:
+            call.usage(*gemini_usage(response.usage_metadata))
+        return response.text
+
+    def stream(self, params, call):
+        for chunk in gemini().models.generate_content_stream(**params):
+            # Every chunk carries the usage so far
+            if chunk.usage_metadata:
+                call.usage(*gemini_usage(chunk.usage_metadata))
+            if chunk.text:
+                yield chunk.text
+
+    async def astream(self, params, call):
+        response = await gemini().aio.models.generate_content_stream(**params)
+        async for chunk in response:
+            if chunk.usage_metadata:
+                call.usage(*gemini_usage(chunk.usage_metadata))
+            if chunk.text:
+                yield chunk.text
+
+
+class OllamaChat:
+    """Ollama takes sampling settings as options and keeps the model loaded."""
+
+    def request(self, model, messages, options):
+        params = {"model": model, "messages": messages}
+        if "format" in options:
+            params["format"] = options.pop("format")
+        if "max_tokens" in options:
+            options["num_predict"] = options.pop("max_tokens")
+        if options:
+            params["options"] = options
+        return params
+
+    def create(self, params, call):
+        response = sync_ollama().chat(**params, keep_alive=KEEP_ALIVE)
+        call.usage(*ollama_usage(response))
+        return response.message.content
+
+    async def acreate(self, params, call):
+        response = await async_ollama().chat(**params, keep_alive=KEEP_ALIVE)
+        call.usage(*ollama_usage(response))
+        return response.message.content
+
+    def stream(self, params, call):
+        for chunk in sync_ollama().chat(**params, stream=True, keep_alive=KEEP_ALIVE):
+            # The last chunk carries the token counts
+            if chunk.done:
+                call.usage(*ollama_usage(chunk))
+            if chunk.message and chunk.message.content:
+                yield chunk.message.content
+
+    async def astream(self, params, call):
+        response = await async_ollama().chat(
+            **params, stream=True, keep_alive=KEEP_ALIVE
+        )
+        async for chunk in response:
+            if chunk.done:
+                call.usage(*ollama_usage(chunk))
+            if chunk.message and chunk.message.content:
+                yield chunk.message.content
+
+
+PROVIDERS = {
+    "openai": OpenAIChat(),
+    "anthropic": ClaudeChat(),
+    "gemini": GeminiChat(),
+    "ollama": OllamaChat(),
+}
+
+
+def _prepare(provider, model, messages, options):
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown provider {provider}")
+    adapter = PROVIDERS[provider]
+    return adapter, adapter.request(model, messages, dict(options))
+
+
+def chat(provider, model, messages, site=None, cache=True, validate=None, **options):
+    """
+    Argument: OpenAI style messages, system messages included; options are
+    passed to the provider (temperature, max_tokens, response_format, ...)
+    Return: the reply text, from the LLM cache unless cache is False
+    """
+    adapter, params = _prepare(provider, model, messages, options)
+    with ModelCall(provider, model, site) as call:
+
+        def create():
+            call.send()
+            return adapter.create(params, call)
+
+        if not cache:
+            return create()
+        return llm_cache.call(provider, params, create, validate)
+
+
+async def achat(
+    provider, model, messages, site=None, cache=True, validate=None, **options
+):
+    """Async version of chat()."""
+    adapter, params = _prepare(provider, model, messages, options)
+    async with ModelCall(provider, model, site) as call:
+
+        async def create():
+            await call.asend()
+            return await adapter.acreate(params, call)
+
+        if not cache:
+            return await create()
+        return await llm_cache.acall(provider, params, create, validate)
+
+
+def stream(provider, model, messages, site=None, cache=True, **options):
+    """
+    Same arguments as chat()
+    Return: a generator of text deltas; cached replies are replayed
+    """
+    adapter, params = _prepare(provider, model, messages, options)
+    call = ModelCall(provider, model, site, streamed=True)
+
+    def deltas():
+        call.send()
+        for delta in adapter.stream(params, call):
+            call.token()
+            yield delta
+
+    def observed():
+        with call:
+            if cache:
+                yield from llm_cache.stream(provider, params, deltas)
+            else:
+                yield from deltas()
+
+    return observed()
+
+
+def astream(provider, model, messages, site=None, cache=True, **options):
+    """Async version of stream(), returns an async generator."""
+    adapter, params = _prepare(provider, model, messages, options)
+    call = ModelCall(provider, model, site, streamed=True)
+
+    async def deltas():
+        await call.asend()
+        async for delta in adapter.astream(params, call):
+            call.token()
+            yield delta
+
+    async def observed():
+        source = llm_cache.astream(provider, params, deltas) if cache else deltas()
+        async with call:
+            try:
+                async for delta in source:
+                    yield delta
+            finally:
+                await source.aclose()
+
+    return observed()
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+CACHE_PATH = Path(__file__).resolve().parent.parent / ".cache" / "llm_cache.sqlite"
+CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 24 * 3600))  # Seconds
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 2_000))
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1").lower() not in ("0", "false", "no")
+
+# Cached answers are replayed in word-sized chunks, optionally paced
+REPLAY_DELAY = float(os.getenv("LLM_CACHE_REPLAY_DELAY", 0))
+REPLAY_CHUNK = re.compile(r"\S+\s*|\s+")
+
+
+def is_json(answer):
+    try:
+        json.loads(answer)
+        return True
+    except ValueError:
+        return False
+
+
+def cache_key(provider, params):
+    """
+    Argument: provider name and every request parameter that changes the answer
+    (model, messages, temperature, tools, format, ...)
+    Return: a stable hash of the canonical JSON of both
+    """
+    canonical = json.dumps(
+        {"provider": provider, **params},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class LLMCache:
+    """
+    Disk-backed cache of model answers with a time-to-live and a size-bounded
+    LRU. Works for plain calls and replays cached answers for streaming calls.
+    """
+
+    def __init__(
+        self,
+        path=CACHE_PATH,
+        ttl=CACHE_TTL,
+        max_entries=CACHE_MAX_ENTRIES,
+        enabled=CACHE_ENABLED,
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT,
+                    answer TEXT,
+                    created_at REAL,
+                    used_at REAL
+                )
+                """
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT answer, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] < self.ttl:
+                db.execute("UPDATE answers SET used_at = ? WHERE key = ?", (now, key))
+                with self._lock:
+                    self.hits += 1
+                return row[0]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, provider, answer):
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+                (key, provider, answer, now, now),
+            )
+            db.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+            # Evict least recently used answers beyond the size bound
+            db.execute(
+                "DELETE FROM answers WHERE key IN ("
+                "SELECT key FROM answers ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def call(self, provider, params, call, validate=None):
+        """
+        Return the cached answer for params, or call() and cache what it returns.
+        call() must return the answer text; answers failing validate() are not
+        cached.
+        """
+        if not self.enabled:
+            return call()
+        key = cache_key(provider, params)
+        answer = self.get(key)
+        if answer is None:
+            answer = call()
+            if answer and (validate is None or validate(answer)):
+                self.set(key, provider, answer)
+        return answer
+
+    def stream(self, provider, params, stream):
+        """
+        Yield the answer for params as text deltas. A cached answer is replayed
+        in chunks; otherwise the deltas from stream() are passed through and the
+        full answer is cached once the stream has finished.
+        """
+        if not self.enabled:
+            yield from stream()
+            return
+        key = cache_key(provider, params)
+        answer = self.get(key)
+        if answer is not None:
+            for chunk in REPLAY_CHUNK.findall(answer):
+                yield chunk
+                if REPLAY_DELAY:
+                    time.sleep(REPLAY_DELAY)
+            return
+
+        deltas = []
+        for delta in stream():
+            deltas.append(delta)
+            yield delta
+        if deltas:
+            self.set(key, provider, "".join(deltas))
+
+    async def acall(self, provider, params, call, validate=None):
+        """Async version of call(); call() must be a coroutine function."""
+        if not self.enabled:
+            return await call()
+        key = cache_key(provider, params)
+        answer = await asyncio.to_thread(self.get, key)
+        if answer is None:
+            answer = await call()
+            if answer and (validate is None or validate(answer)):
+                await asyncio.to_thread(self.set, key, provider, answer)
+        return answer
+
+    async def astream(self, provider, params, stream):
+        """Async version of stream(); stream() must return an async generator."""
+        if not self.enabled:
+            async for delta in stream():
+                yield delta
+            return
+        key = cache_key(provider, params)
+        answer = await asyncio.to_thread(self.get, key)
+        if answer is not None:
+            for chunk in REPLAY_CHUNK.findall(answer):
+                yield chunk
+                if REPLAY_DELAY:
+                    await asyncio.sleep(REPLAY_DELAY)
+            return
+
+        deltas = []
+        async for delta in stream():
+            deltas.append(delta)
+            yield delta
+        if deltas:
+            await asyncio.to_thread(self.set, key, provider, "".join(deltas))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,46 @@
+from rich.live import Live
+from rich.markdown import Markdown
+
+from common.streaming import coalesce
+
+FENCES = ("```", "~~~")
+
+
+def split_blocks(text):
+    """
+    Argument: streamed markdown that has not been frozen yet
+    Return: (completed, open) where completed ends at the last blank line that
+    is not inside a code fence, so it will not change as more text arrives
+    """
+    in_fence = False
+    cut = position = 0
+    # The last line may still be growing, so only complete lines are checked
+    for line in text.split("\n")[:-1]:
+        position += len(line) + 1
+        stripped = line.strip()
+        if stripped.startswith(FENCES):
+            in_fence = not in_fence
+        elif not stripped and not in_fence:
+            cut = position
+    return text[:cut], text[cut:]
+
+
+def live_markdown(deltas, console, refresh_per_second=10):
+    """
+    Render streamed markdown in a rich Live display. Completed blocks are
+    printed once above the display and never re-parsed; only the open trailing
+    block is re-rendered, at most refresh_per_second times.
+    Return: the full text
+    """
+    chunks = []
+    open_block = ""
+
+    with Live(console=console, auto_refresh=False) as live:
+        for chunk in coalesce(deltas, interval=1 / refresh_per_second):
+            chunks.append(chunk)
+            completed, open_block = split_blocks(open_block + chunk)
+            if completed.strip():
+                live.console.print(Markdown(completed))
+            live.update(Markdown(open_block), refresh=True)
+
+    return "".join(chunks)
@@ -0,0 +1,29 @@
+import os
+
+# How long Ollama keeps a model (and its prompt cache) loaded between calls
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+
+def cached_system(text):
+    """
+    Argument: a static Anthropic system prompt
+    Return: the system blocks with a cache breakpoint after the prompt, so the
+    provider can reuse it across calls (prompts below the model's minimum
+    cacheable length are sent uncached)
+    """
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+
+def prompt_tokens(usage):
+    """
+    Argument: the usage of an OpenAI or Anthropic response
+    Return: (prompt tokens, prompt tokens read from the provider's cache)
+    """
+    if hasattr(usage, "prompt_tokens"):
+        details = getattr(usage, "prompt_tokens_details", None)
+        return usage.prompt_tokens, getattr(details, "cached_tokens", 0) or 0
+
+    cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+    return usage.input_tokens + cache_read + cache_write, cache_read
+
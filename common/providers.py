@@ -0,0 +1,65 @@
+import os
+from functools import lru_cache
+
+import anthropic
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
+
+# Connections kept open per provider, shared by every concurrent session
+MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", 500))
+# Gradio events handled at once per handler
+CONCURRENCY_LIMIT = int(os.getenv("GRADIO_CONCURRENCY_LIMIT", 200))
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS
+    )
+
+
+@lru_cache(maxsize=None)
+def async_openai():
+    """Return: the process-wide AsyncOpenAI client on one pooled transport"""
+    return AsyncOpenAI(http_client=DefaultAsyncHttpxClient(limits=_limits()))
+
+
+@lru_cache(maxsize=None)
+def async_claude():
+    """Return: the process-wide AsyncAnthropic client on one pooled transport"""
+    return anthropic.AsyncAnthropic(
+        http_client=anthropic.DefaultAsyncHttpxClient(limits=_limits())
+    )
+
+
+@lru_cache(maxsize=None)
+def sync_openai():
+    """Return: the process-wide OpenAI client, for blocking calls"""
+    return OpenAI()
+
+
+@lru_cache(maxsize=None)
+def sync_claude():
+    """Return: the process-wide Anthropic client, for blocking calls"""
+    return anthropic.Anthropic()
+
+
+@lru_cache(maxsize=None)
+def gemini():
+    """Return: the process-wide Gemini client, async calls go through .aio"""
+    from google import genai
+
+    return genai.Client()
+
+
+@lru_cache(maxsize=None)
+def sync_ollama():
+    import ollama
+
+    return ollama.Client()
+
+
+@lru_cache(maxsize=None)
+def async_ollama():
+    import ollama
+
+    return ollama.AsyncClient()
@@ -0,0 +1,98 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+MAX_SESSIONS = int(os.getenv("SESSION_MAX_IN_MEMORY", 1_000))
+# Set SESSION_DB to a file path to keep sessions on disk across evictions/restarts
+SESSION_DB = os.getenv("SESSION_DB")
+
+
+def completed_turns(messages):
+    """
+    Argument: a session's messages
+    Return: (user, assistant) pairs of the completed turns
+    """
+    return [
+        (user["content"], assistant["content"])
+        for user, assistant in zip(messages[::2], messages[1::2])
+    ]
+
+
+class SessionStore:
+    """
+    The canonical message list of every chat session, keyed by session id.
+    Sessions live in an in-memory LRU; with a SQLite path every appended
+    message is also written through to disk, so evicted sessions are loaded
+    back on demand instead of being lost.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS, path=SESSION_DB):
+        self.max_sessions = max_sessions
+        self.path = Path(path) if path else None
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as db:
+                db.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS messages (
+                        session_id TEXT,
+                        position INTEGER,
+                        message TEXT,
+                        PRIMARY KEY (session_id, position)
+                    )
+                    """
+                )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _load(self, session_id):
+        if not self.path:
+            return []
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT message FROM messages WHERE session_id = ? ORDER BY position",
+                (session_id,),
+            ).fetchall()
+        return [json.loads(message) for (message,) in rows]
+
+    def _session(self, session_id):
+        # Caller holds the lock
+        if session_id not in self._sessions:
+            self._sessions[session_id] = self._load(session_id)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return self._sessions[session_id]
+
+    def get(self, session_id):
+        """Return: the session's messages; treat the list as read-only"""
+        with self._lock:
+            return self._session(session_id)
+
+    def append(self, session_id, *messages):
+        with self._lock:
+            session = self._session(session_id)
+            start = len(session)
+            session.extend(messages)
+        if self.path:
+            with self._connect() as db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO messages VALUES (?, ?, ?)",
+                    [
+                        (session_id, start + offset, json.dumps(message))
+                        for offset, message in enumerate(messages)
+                    ],
+                )
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.path:
+            with self._connect() as db:
+                db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
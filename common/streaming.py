@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+FLUSH_INTERVAL = 0.04  # Seconds between UI updates while a model is streaming
+FLUSH_CHARS = 2_000  # Flush early once this much text is waiting
+
+_DONE = object()
+
+
+def coalesce(
+    deltas, interval=FLUSH_INTERVAL, max_chars=FLUSH_CHARS, clock=time.monotonic
+):
+    """
+    Merge small text deltas into larger ones, at most one per interval.
+    Return: only the newly appended text each time
+    """
+    pending = []
+    pending_chars = 0
+    last_flush = clock()
+
+    try:
+        for delta in deltas:
+            if not delta:
+                continue
+            pending.append(delta)
+            pending_chars += len(delta)
+            now = clock()
+            if now - last_flush >= interval or pending_chars >= max_chars:
+                yield "".join(pending)
+                pending, pending_chars, last_flush = [], 0, now
+    finally:
+        # Stop the provider stream too when the UI stops listening
+        close = getattr(deltas, "close", None)
+        if close:
+            close()
+
+    if pending:
+        yield "".join(pending)
+
+
+def accumulate(
+    deltas, interval=FLUSH_INTERVAL, max_chars=FLUSH_CHARS, clock=time.monotonic
+):
+    """
+    Return: the text so far after each coalesced delta, for Gradio outputs that
+    take the full value. Gradio only sends the appended part to the browser,
+    and coalescing keeps the number of updates (and re-diffs) per answer low.
+    """
+    text = ""
+    for chunk in coalesce(deltas, interval, max_chars, clock):
+        text += chunk
+        yield text
+
+
+async def acoalesce(
+    deltas, interval=FLUSH_INTERVAL, max_chars=FLUSH_CHARS, clock=time.monotonic
+):
+    """Async version of coalesce() for async generators."""
+    pending = []
+    pending_chars = 0
+    last_flush = clock()
+
+    try:
+        async for delta in deltas:
+            if not delta:
+                continue
+            pending.append(delta)
+            pending_chars += len(delta)
+            now = clock()
+            if now - last_flush >= interval or pending_chars >= max_chars:
+                yield "".join(pending)
+                pending, pending_chars, last_flush = [], 0, now
+    finally:
+        aclose = getattr(deltas, "aclose", None)
+        if aclose:
+            await aclose()
+
+    if pending:
+        yield "".join(pending)
+
+
+async def aaccumulate(
+    deltas, interval=FLUSH_INTERVAL, max_chars=FLUSH_CHARS, clock=time.monotonic
+):
+    """Async version of accumulate() for async Gradio handlers."""
+    text = ""
+    async for chunk in acoalesce(deltas, interval, max_chars, clock):
+        text += chunk
+        yield text
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+async def _aconsume(index, stream, items):
+    try:
+        async for item in stream:
+            await items.put((index, item))
+    except Exception as e:
+        # Passed on and raised by ainterleave, so the UI shows the error
+        items.put_nowait((index, _Failed(e)))
+    finally:
+        items.put_nowait((index, _DONE))
+        aclose = getattr(stream, "aclose", None)
+        if aclose:
+            await aclose()
+
+
+async def ainterleave(streams):
+    """
+    Run several async generators at once, each as a task on the event loop.
+    Return: (index, item) pairs in the order the items arrive. Closing this
+    generator (e.g. when Gradio cancels the event) cancels every stream; the
+    first stream to fail raises its exception here and cancels the others.
+    """
+    items = asyncio.Queue()
+    tasks = [
+        asyncio.create_task(_aconsume(index, stream, items))
+        for index, stream in enumerate(streams)
+    ]
+
+    remaining = len(tasks)
+    try:
+        while remaining:
+            index, item = await items.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            if isinstance(item, _Failed):
+                raise item.error
+            yield index, item
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,111 @@
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from common.context import CHARS_PER_TOKEN, count_tokens
+
+MIN_CHUNK_SHARE = 0.5  # A chunk may end early at a cut point once this full
+CUT_EVERY = 8  # About one line in this many is a content-defined cut point
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def is_heading(line):
+    """Return: True for a short line that does not end like a sentence"""
+    short = 0 < len(line.split()) <= 8 and len(line) < 60
+    return short and not line.endswith((".", ",", ":"))
+
+
+def is_cut_point(line):
+    """
+    A line a chunk may start at. Cut points depend only on the line itself, so
+    an edit in one part of a page leaves the chunks of the other parts, and
+    their cached summaries, unchanged.
+    """
+    return is_heading(line) or zlib.crc32(line.encode()) % CUT_EVERY == 0
+
+
+def split_long(line, budget, model=None):
+    """Return: pieces of a line over budget, split at sentences, then at words"""
+    if count_tokens(line, model) <= budget:
+        return [line]
+    pieces = []
+    current = ""
+    for sentence in SENTENCE_END.split(line):
+        candidate = f"{current} {sentence}".strip()
+        if current and count_tokens(candidate, model) > budget:
+            pieces.append(current)
+            candidate = sentence
+        current = candidate
+    if current:
+        pieces.append(current)
+
+    # A single sentence over budget is cut at word boundaries
+    limit = budget * CHARS_PER_TOKEN
+    split = []
+    for piece in pieces:
+        while count_tokens(piece, model) > budget:
+            cut = piece.rfind(" ", 0, limit)
+            cut = cut if cut > 0 else limit
+            split.append(piece[:cut])
+            piece = piece[cut:].strip()
+        split.append(piece)
+    return split
+
+
+def split_chunks(text, budget, model=None):
+    """
+    Split text into chunks of whole lines within budget tokens. A chunk ends
+    before a heading or other cut point once it is half full, or when the next
+    line would not fit.
+    """
+    chunks = []
+    current = []
+    tokens = 0
+    for line in text.split("\n"):
+        for piece in split_long(line, budget, model):
+            size = count_tokens(piece, model)
+            if current and (
+                tokens + size > budget
+                or (tokens >= budget * MIN_CHUNK_SHARE and is_cut_point(piece))
+            ):
+                chunks.append("\n".join(current))
+                current, tokens = [], 0
+            current.append(piece)
+            tokens += size + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def group_summaries(summaries, budget, model=None):
+    """Return: consecutive summaries grouped within budget, at least two a group"""
+    groups = []
+    current = []
+    tokens = 0
+    for summary in summaries:
+        size = count_tokens(summary, model)
+        if len(current) >= 2 and tokens + size > budget:
+            groups.append(current)
+            current, tokens = [], 0
+        current.append(summary)
+        tokens += size
+    if len(current) == 1 and groups:
+        groups[-1].append(current[0])
+    elif current:
+        groups.append(current)
+    return groups
+
+
+def map_reduce(chunks, summarize, merge, budget, model=None, workers=1):
+    """
+    Summarize chunks concurrently, then merge the partial summaries in rounds
+    of groups that fit the budget until one summary is left.
+    Argument: summarize(chunk) and merge(summaries) return summary text
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        summaries = list(pool.map(summarize, chunks))
+        while len(summaries) > 1:
+            groups = group_summaries(summaries, budget, model)
+            summaries = list(pool.map(merge, groups))
+    return summaries[0]
@@ -0,0 +1,162 @@
+import asyncio
+import inspect
+import json
+import threading
+from collections import OrderedDict
+
+MAX_TOOL_ROUNDS = 4  # Model calls that may ask for tools before it has to answer
+MAX_SESSIONS = 1_000
+
+
+def memo_key(name, arguments):
+    return f"{name}({json.dumps(arguments, sort_keys=True, ensure_ascii=False)})"
+
+
+class ToolMemo:
+    """Tool results per session id, least recently used sessions are dropped."""
+
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            if session_id not in self._sessions:
+                self._sessions[session_id] = {}
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return self._sessions[session_id]
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+def known_results(memo):
+    """
+    Argument: a session's tool results
+    Return: a system message listing them, so the model can answer repeated
+    questions without calling the tool again, or None when there are none
+    """
+    if not memo:
+        return None
+    results = "\n".join(
+        f"{key} -> {json.dumps(result, ensure_ascii=False)}"
+        for key, result in memo.items()
+    )
+    return {
+        "role": "system",
+        "content": f"Results of tool calls earlier in this conversation:\n{results}",
+    }
+
+
+def is_complete(call):
+    """Return: True once a streamed tool call has its name and all its arguments"""
+    if not call["name"]:
+        return False
+    try:
+        # A JSON object only parses once its closing brace has arrived
+        return isinstance(json.loads(call["arguments"]), dict)
+    except ValueError:
+        return False
+
+
+class ToolRunner:
+    """
+    Runs the tool calls of a streamed chat completion. A tool starts as soon as
+    its arguments are complete, while the rest of the reply is still streaming,
+    and results are memoized per session by name and arguments.
+    """
+
+    def __init__(self, functions, max_rounds=MAX_TOOL_ROUNDS):
+        self.functions = functions  # Tool name -> function or coroutine function
+        self.max_rounds = max_rounds
+
+    async def call(self, call_id, name, arguments, memo):
+        try:
+            arguments = json.loads(arguments or "{}")
+            key = memo_key(name, arguments)
+            if key not in memo:
+                function = self.functions[name]
+                if inspect.iscoroutinefunction(function):
+                    memo[key] = await function(**arguments)
+                else:
+                    # Blocking lookups run off the event loop
+                    memo[key] = await asyncio.to_thread(function, **arguments)
+            result = memo[key]
+        except Exception as e:
+            # The model is told about the failure instead of the chat failing
+            result = {"error": f"{type(e).__name__}: {e}"}
+
+        return {
+            "role": "tool",
+            "content": json.dumps(result, ensure_ascii=False),
+            "tool_call_id": call_id,
+        }
+
+    async def stream(self, create, messages, memo):
+        """
+        Argument: create(messages, final) returns one streamed model call as
+        chat completion chunks; final is True for the last allowed round, which
+        must not ask for tools
+        Return: the text deltas of every round; messages is extended with the
+        tool calls and their results
+        """
+        for step in range(self.max_rounds + 1):
+            text = []
+            calls = {}  # Index -> {"id", "name", "arguments"}
+            tasks = {}
+            try:
+                async for chunk in create(messages, final=step == self.max_rounds):
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        text.append(delta.content)
+                        yield delta.content
+                    for fragment in delta.tool_calls or ():
+                        call = calls.setdefault(
+                            fragment.index, {"id": "", "name": "", "arguments": ""}
+                        )
+                        call["id"] += fragment.id or ""
+                        if fragment.function:
+                            call["name"] += fragment.function.name or ""
+                            call["arguments"] += fragment.function.arguments or ""
+                        if fragment.index not in tasks and is_complete(call):
+                            tasks[fragment.index] = self.start(call, memo)
+
+                if not calls:
+                    return
+                for index, call in calls.items():
+                    if index not in tasks:
+                        tasks[index] = self.start(call, memo)
+                results = await asyncio.gather(*(tasks[index] for index in calls))
+            finally:
+                for task in tasks.values():
+                    task.cancel()
+
+            messages.append(
+                {
+                    "role": "assistant",
+                    "content": "".join(text) or None,
+                    "tool_calls": [
+                        {
+                            "id": call["id"],
+                            "type": "function",
+                            "function": {
+                                "name": call["name"],
+                                "arguments": call["arguments"],
+                            },
+                        }
+                        for call in calls.values()
+                    ],
+                }
+            )
+            messages.extend(results)
+
+    def start(self, call, memo):
+        return asyncio.create_task(
+            self.call(call["id"], call["name"], call["arguments"], memo)
+        )
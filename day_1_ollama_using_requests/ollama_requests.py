@@ -1,4 +1,9 @@
-import requests
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.fetch import post
+
 # from bs4 import BeautifulSoup
 
 OLLAMA_API = "http://localhost:11434/api/chat/"
@@ -20,7 +25,8 @@ payload = {
     "stream": False,
 }
 
-response = requests.post(OLLAMA_API, json=payload, headers=HEADERS)
+# Generation can take a while on a local model, so allow a long read timeout
+response = post(OLLAMA_API, json=payload, headers=HEADERS, timeout=300)
 print("Status Code:", response.status_code)
 if response.status_code == 200:
     data = response.json()
@@ -1,6 +1,19 @@
-import ollama
-from bs4 import BeautifulSoup
-import requests
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.boilerplate import site_index
+from common.extract import extract
+from common.fetch import MAX_WORKERS
+from common.http_cache import http_cache
+from common.llm import chat, metrics
+from common.summarize import map_reduce, split_chunks
 
 headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
@@ -8,54 +21,221 @@ headers = {
 
 MODEL = "llama3.2"
 
+# Batch mode: pages fetched at once, and summaries generated at once. Ollama
+# only runs OLLAMA_NUM_PARALLEL requests per model (4 by default when memory
+# allows), more would just queue there.
+IO_WORKERS = int(os.getenv("BATCH_IO_WORKERS", MAX_WORKERS))
+INFERENCE_WORKERS = int(os.getenv("OLLAMA_NUM_PARALLEL", 4))
+
+# Pages longer than this are summarized in parts and the parts merged, so the
+# prompt stays within the context Ollama loads the model with (num_ctx)
+CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", 1_500))
+
+SYSTEM_PROMPT = "You are an assistant that analyzes the contents of a website \
+and provides a short summary, ignoring text that might be navigation related. \
+Respond in markdown."
+
 
 class Website:
     def __init__(self, url):
-        website_response = requests.get(url, headers=headers)
+        self.url = url
+        website_response = http_cache.get(url, headers=headers)
         website_content = website_response.content
 
-        website_soup = BeautifulSoup(website_content, "html.parser")
-        self.title = (
-            website_soup.title.string if website_soup.title else "No title found"
-        )
-        # Remove the irrelevant content from body
-        for irrelevant in website_soup.body(["script", "style", "img", "input"]):
-            irrelevant.decompose()
-        self.text = website_soup.body.get_text(separator="\n", strip=True)
+        # Single pass over the html, script/style/img/input content is skipped
+        page = extract(website_content)
+        self.title = page.title or "No title found"
+        self.text = page.text
+        # Count this page towards the header/nav/footer lines of its site
+        site_index(url).add(self.text, key=url)
 
 
-def get_user_prompt(website: Website):
+def get_user_prompt(website: Website, text=None):
     user_prompt = f"You are looking at website titled {website.title}"
     user_prompt += "\nThe contents of this website is as follows; \
 please provide a short summary of this website in markdown. \
 If it includes news or announcements, then summarize these too.\n\n"
-    user_prompt += website.text
+    user_prompt += site_index(website.url).strip(website.text) if text is None else text
 
     return user_prompt
 
 
-def get_messages_for(website: Website):
-    SYSTEM_PROMPT = "You are an assistant that analyzes the contents of a website \
-and provides a short summary, ignoring text that might be navigation related. \
-Respond in markdown."
+def get_chunk_prompt(website: Website, chunk):
+    # No part number in the prompt: the cache key of a part is its content only
+    user_prompt = f"You are looking at part of a website titled {website.title}"
+    user_prompt += "\nThe contents of this part are as follows; \
+please provide a short summary of this part in markdown, keeping any news, \
+announcements, products and figures it mentions.\n\n"
+    user_prompt += chunk
+
+    return user_prompt
+
+
+def get_merge_prompt(website: Website, summaries):
+    user_prompt = f"Below are summaries of consecutive parts of a website titled \
+{website.title}. Combine them into one short summary of the website in markdown. \
+If they include news or announcements, then summarize these too.\n\n"
+    user_prompt += "\n\n---\n\n".join(summaries)
 
+    return user_prompt
+
+
+def get_messages_for(website: Website, user_prompt=None):
     messages = [
         {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": get_user_prompt(website)},
+        {"role": "user", "content": user_prompt or get_user_prompt(website)},
     ]
 
     return messages
 
 
-def summarize(url):
-    website = Website(url)
-    response = ollama.chat(model=MODEL, messages=get_messages_for(website))
-    return response.message.content
+def ask(messages, site):
+    """Return: the model reply, cached by a hash of the messages"""
+    return chat("ollama", MODEL, messages, site=site)
 
 
-def display(url):
-    summary = summarize(url)
-    print(summary)
+def summarize_website(website: Website, workers=INFERENCE_WORKERS):
+    """
+    Summarize a page in one call, or, when it is longer than CHUNK_TOKENS,
+    summarize its parts concurrently and merge the part summaries. Each part
+    and merge is cached by its content, so a page that changed in one place
+    only reruns the parts that changed.
+    """
+    text = site_index(website.url).strip(website.text)
+    chunks = split_chunks(text, CHUNK_TOKENS, MODEL)
+    if len(chunks) <= 1:
+        prompt = get_user_prompt(website, text)
+        return ask(get_messages_for(website, prompt), "summary")
+
+    def summarize_part(chunk):
+        prompt = get_chunk_prompt(website, chunk)
+        return ask(get_messages_for(website, prompt), "summary/part")
+
+    def merge(parts):
+        prompt = get_merge_prompt(website, parts)
+        return ask(get_messages_for(website, prompt), "summary/merge")
 
+    return map_reduce(chunks, summarize_part, merge, CHUNK_TOKENS, MODEL, workers)
 
-display("https://www.hapsoul.com")
+
+def summarize(url, workers=INFERENCE_WORKERS):
+    return summarize_website(Website(url), workers)
+
+
+def display(url, workers=INFERENCE_WORKERS):
+    summary = summarize(url, workers)
+    print(summary)
+    print(f"Model calls: {metrics.report()}")
+
+
+def read_urls(source):
+    """
+    Argument: a file with one URL per line, or "-" for stdin
+    Return: the URLs in order without duplicates, blank and # lines skipped
+    """
+    lines = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    with lines:
+        urls = [line.strip() for line in lines]
+    return list(dict.fromkeys(url for url in urls if url and not url.startswith("#")))
+
+
+def completed_urls(output):
+    """Return: the URLs already summarized in the JSONL output, the checkpoint"""
+    done = set()
+    if not output.exists():
+        return done
+    with output.open(encoding="utf-8") as results:
+        for line in results:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash
+            if "summary" in result:
+                done.add(result["url"])
+    return done
+
+
+def summarize_batch(
+    urls, output, io_workers=IO_WORKERS, inference_workers=INFERENCE_WORKERS
+):
+    """
+    Summarize many URLs, fetching pages on one pool and running the model on
+    another. Every result is appended to the JSONL output as soon as it is
+    ready; URLs already summarized there are skipped, so a rerun resumes.
+    Failed URLs are written with an error and retried by the next run.
+    """
+    output = Path(output)
+    done = completed_urls(output)
+    todo = [url for url in urls if url not in done]
+    print(f"{len(done)} URLs already summarized, {len(todo)} to go")
+
+    results = queue.Queue()
+    # Pages fetched but not summarized yet; fetching stays just ahead of the
+    # model instead of holding thousands of pages in memory
+    slots = threading.BoundedSemaphore(io_workers + 2 * inference_workers)
+
+    def infer(url, website):
+        try:
+            summary = summarize_website(website, inference_workers)
+            results.put({"url": url, "title": website.title, "summary": summary})
+        except Exception as e:
+            results.put({"url": url, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            slots.release()
+
+    def fetch(url):
+        try:
+            website = Website(url)
+        except Exception as e:
+            results.put({"url": url, "error": f"{type(e).__name__}: {e}"})
+            slots.release()
+            return
+        inference_pool.submit(infer, url, website)
+
+    def feed():
+        for url in todo:
+            slots.acquire()
+            io_pool.submit(fetch, url)
+
+    with (
+        ThreadPoolExecutor(io_workers) as io_pool,
+        ThreadPoolExecutor(inference_workers) as inference_pool,
+    ):
+        threading.Thread(target=feed, daemon=True).start()
+
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with output.open("a+b") as out:
+            # Close a line cut short by a crash before appending after it
+            if out.tell():
+                out.seek(-1, os.SEEK_END)
+                if out.read(1) != b"\n":
+                    out.write(b"\n")
+            for count in range(1, len(todo) + 1):
+                result = results.get()
+                out.write(json.dumps(result, ensure_ascii=False).encode() + b"\n")
+                out.flush()
+                status = "error: " + result["error"] if "error" in result else "done"
+                print(f"[{count}/{len(todo)}] {result['url']} {status}")
+    print(f"Model calls: {metrics.report()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize websites with Ollama")
+    parser.add_argument("url", nargs="?", default="https://www.hapsoul.com")
+    parser.add_argument(
+        "--batch", metavar="FILE", help='file with one URL per line, "-" for stdin'
+    )
+    parser.add_argument("--output", default="summaries.jsonl")
+    parser.add_argument("--io-workers", type=int, default=IO_WORKERS)
+    parser.add_argument("--inference-workers", type=int, default=INFERENCE_WORKERS)
+    args = parser.parse_args()
+
+    if args.batch:
+        summarize_batch(
+            read_urls(args.batch),
+            args.output,
+            args.io_workers,
+            args.inference_workers,
+        )
+    else:
+        display(args.url, args.inference_workers)
@@ -1,42 +1,58 @@
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 import json
-import requests
-from bs4 import BeautifulSoup
-import ollama
 from rich.console import Console
-from rich.markdown import Markdown
-from rich.live import Live
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.extract import extract
+from common.boilerplate import site_index
+from common.context import ContextPacker, token_budget
+from common.crawl import candidate_links
+from common.fetch import fetch_all, MAX_WORKERS
+from common.http_cache import http_cache
+from common.link_classifier import classify_links
+from common.llm import chat, metrics, stream
+from common.llm_cache import is_json
+from common.markdown_live import live_markdown
+from common.page_cache import PageCache
 
 headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
 }
 
 MODEL = "llama3.2"
+LANDING_PAGE_WEIGHT = 2  # Landing page gets twice the token share of a sub-page
 
 
 class Website:
     def __init__(self, url):
         self.url = url
-        response = requests.get(url, headers=headers)
+        response = http_cache.get(url, headers=headers)
         self.body = response.content
+        # Links on the page are relative to where any redirects ended
+        self.url = response.url or url
 
-        soup = BeautifulSoup(self.body, "html.parser")
-        self.title = soup.title.string if soup.title else "No title found"
-        if soup.body:
-            for irrelevant in soup.body(["script", "style", "img", "input"]):
-                irrelevant.decompose()
-            self.text = soup.body.get_text(separator="\n", strip=True)
-        else:
-            self.text = ""
-
-        links = [link.get("href") for link in soup.find_all("a")]
-        self.links = [link for link in links if link]
+        # Single pass over the html, script/style/img/input content is skipped
+        page = extract(self.body)
+        self.title = page.title or "No title found"
+        self.text = page.text
+        self.links = page.links
+        self.anchors = page.anchors
 
     def get_contents(self):
         return f"Website title:\n{self.title}\nWebsite contents:\n{self.text}\n\n"
 
 
+# One parsed page per url, shared by link selection and content extraction
+page_cache = PageCache(max_entries=128, ttl=600)
+
+
+def get_website(url):
+    return page_cache.get(url, Website)
+
+
 # website = Website("https://huggingface.com")
 # print(website.links)
 
@@ -55,48 +71,72 @@ link_system_prompt += """
 """
 
 
-def get_links_user_prompt(website: Website):
+def get_links_user_prompt(website: Website, candidates):
     user_prompt = f"Here is the list of links on the website of {website.url} - "
     user_prompt += (
         "please decide which of these are relevant web links for a brochure about the company, respond with the full https URL in JSON format. \
 Do not include Terms of Service, Privacy, email links.\n"
     )
-    user_prompt += "Links (some might be relative links):\n"
-    user_prompt += "\n".join(website.links)
+    user_prompt += "Links:\n"
+    # Deduplicated same-site links from a short crawl, best ranked first
+    user_prompt += "\n".join(candidate.url for candidate in candidates)
     return user_prompt
 
 
 def get_links(url):
-    website = Website(url)
-    user_prompt = get_links_user_prompt(website)
+    website = get_website(url)
+    candidates = candidate_links(website.url, get_website, landing=website)
+    # The local classifier answers most sites, only unclear ones go to the model
+    links, confident = classify_links(candidates)
+    if confident:
+        return links
+    user_prompt = get_links_user_prompt(website, candidates)
 
     messages = [
         {"role": "system", "content": link_system_prompt},
         {"role": "user", "content": user_prompt},
     ]
 
-    response = ollama.chat(model=MODEL, messages=messages, format="json")
+    answer = chat(
+        "ollama", MODEL, messages, site="links", validate=is_json, format="json"
+    )
 
-    return json.loads(response.message.content)
+    return json.loads(answer)
 
 
 # print(get_links("https://huggingface.com"))
 
 
-def get_all_details(url):
-    result = "Landing Page:\n"
-    result += Website(url).get_contents()
-    links = get_links(url)
+def add_page(packer, label, website, weight=1.0):
+    header = f"Website title:\n{website.title}\nWebsite contents:\n"
+    packer.add(label, website.text, header=header, weight=weight, key=website.url)
+
+
+def get_all_details(url, model=MODEL):
+    # The site's boilerplate index is kept across requests for the same host
+    packer = ContextPacker(token_budget(model), model, index=site_index(url))
+    add_page(packer, "Landing Page:", get_website(url), weight=LANDING_PAGE_WEIGHT)
+    links = get_links(url)["links"]
 
-    for link in links["links"]:
-        print("Getting the contents of: ", link["url"])
-        try:
-            result += f"\n\n{link['type']}\n{Website(link['url']).get_contents()}"
-        except Exception as e:
-            print(f"Getting error on {link['type']}")
-            continue
+    # Fetch the sub-pages concurrently in relevance order, one batch at a time.
+    # The best ranked batch is always fetched; later batches stop once another
+    # page's share of the budget would be too small to be useful.
+    for start in range(0, len(links), MAX_WORKERS):
+        if start and packer.full:
+            print(f"Token budget full, skipping {len(links) - start} pages")
+            break
+        batch = links[start : start + MAX_WORKERS]
+        for link in batch:
+            print("Getting the contents of: ", link["url"])
 
-    return result
+        pages = fetch_all([link["url"] for link in batch], get_website)
+        for link, page in zip(batch, pages):
+            if page is None:
+                print(f"Getting error on {link['type']}")
+                continue
+            add_page(packer, link["type"], page)
+
+    return packer.pack()
 
 
 system_prompt = "You are an assistant that analyzes the contents of several relevant pages from a company website \
@@ -108,45 +148,36 @@ def get_brochure_user_prompt(company_name, url):
     user_prompt = f"You are looking at a company called: {company_name}\n"
     user_prompt += "Here are the contents of its landing page and other relevant pages; use this information to build a short brochure of the company in markdown.\n"
     user_prompt += get_all_details(url)
-    user_prompt = user_prompt[:5_000]  # Truncate if more than 5,000 characters
+    print(f"Page cache: {page_cache.stats()}")
     return user_prompt
 
 
-def create_brochure(company_name, url):
-    response = ollama.chat(
-        model=MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": get_brochure_user_prompt(company_name, url)},
-        ],
-    )
+def get_brochure_messages(company_name, url):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": get_brochure_user_prompt(company_name, url)},
+    ]
 
-    return response.message.content
+
+def create_brochure(company_name, url):
+    messages = get_brochure_messages(company_name, url)
+    return chat("ollama", MODEL, messages, site="brochure")
 
 
 def stream_brochure(company_name, url):
-    response = ollama.chat(
-        model=MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": get_brochure_user_prompt(company_name, url)},
-        ],
-        stream=True,
-    )
+    messages = get_brochure_messages(company_name, url)
+
+    # Cached brochures are replayed through the same live display
+    response = stream("ollama", MODEL, messages, site="brochure")
 
     console = Console()
-    accumulated_content = ""
 
-    with Live(console=console, refresh_per_second=10) as live:
-        for chunk in response:
-            if chunk.message and chunk.message.content:
-                accumulated_content += chunk.message.content
-                markdown = Markdown(accumulated_content)
-                live.update(markdown)
-        # console.log(response.us)
+    # Finished markdown blocks are frozen, only the open block is re-rendered
+    live_markdown(response, console, refresh_per_second=10)
 
     console.print("\n" + "=" * 50)
     console.print("✅ Brochure generation complete!")
+    console.print(f"Model calls: {metrics.report()}")
 
 
 stream_brochure("Anthropic", "https://www.anthropic.com/")
@@ -1,23 +1,22 @@
-from openai import OpenAI
-import anthropic
-from google import genai
-from google.genai import types
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 from dotenv import load_dotenv
 
 from rich.console import Console
 from rich.markdown import Markdown
 from rich.live import Live
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.llm import metrics, stream
+
 load_dotenv(override=True)
 openai_api_key = os.getenv("OPENAI_API_KEY")
 anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
 google_api_key = os.getenv("GOOGLE_API_KEY")
 
-openai = OpenAI()
-claude = anthropic.Anthropic()
-google_ai = genai.Client()
-
 if openai_api_key:
     print("OpenAI Key exists")
 else:
@@ -41,49 +40,87 @@ prompts = [
     {"role": "user", "content": user_prompt},
 ]
 
-response_3_5 = openai.chat.completions.create(
-    model="gpt-3.5-turbo", messages=prompts, temperature=0.7
-)
-
-response_4o_mini = openai.chat.completions.create(
-    model="gpt-4o-mini", messages=prompts, temperature=0.7
-)
-
-response_4o = openai.chat.completions.create(
-    model="gpt-4o", messages=prompts, temperature=0.7
-)
-
-
-print("\n\n---- GPT 3.5 Turbo ----\n")
-print(response_3_5.choices[0].message.content)
-
-print("\n\n---- GPT 4o Mini ----\n")
-print(response_4o_mini.choices[0].message.content)
 
-print("\n\n---- GPT 4o ----\n")
-print(response_4o.choices[0].message.content)
-print("\n\n")
-
-claude_response = claude.messages.create(
-    model="claude-3-7-sonnet-latest",
-    system=system_message,
-    messages=[{"role": "user", "content": user_prompt}],
-    temperature=0.7,
-    max_tokens=200,
-)
-
-print("\n\n---- Claude Sonnet 3.7 ----\n")
-print(claude_response.content[0].text)
-print("\n\n")
-
-gemini_response = google_ai.models.generate_content(
-    config=types.GenerateContentConfig(
-        system_instruction=system_message, temperature=0.7
-    ),
-    model="gemini-2.5-flash",
-    contents=[user_prompt],
-)
+MODELS = [
+    ("openai", "gpt-3.5-turbo", "GPT 3.5 Turbo"),
+    ("openai", "gpt-4o-mini", "GPT 4o Mini"),
+    ("openai", "gpt-4o", "GPT 4o"),
+    ("anthropic", "claude-3-7-sonnet-latest", "Claude Sonnet 3.7"),
+    ("gemini", "gemini-2.5-flash", "Google Gemini 2.5 Flash"),
+]
 
-print("\n\n---- Google Gemini 2.5 Flash ----\n")
-print(gemini_response.text)
+# USD per million input / output tokens
+PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "claude-3-7-sonnet-latest": (3.00, 15.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+}
+
+
+# Extra request options per provider
+OPTIONS = {"anthropic": {"max_tokens": 200}}
+
+
+def run_model(provider, model):
+    site = f"compare/{model}"
+    start = time.perf_counter()
+    options = {"temperature": 0.7, **OPTIONS.get(provider, {})}
+    answer = "".join(stream(provider, model, prompts, site=site, **options))
+    call = metrics.report()[site]
+
+    input_price, output_price = PRICES.get(model, (0, 0))
+    return {
+        "model": model,
+        "latency": time.perf_counter() - start,
+        "ttft": call["ttft"],
+        "tokens_per_second": call["tokens_per_second"],
+        "cached": bool(call["cache_hits"]),
+        "output_tokens": call["completion"],
+        "cost": (call["prompt"] * input_price + call["completion"] * output_price)
+        / 1_000_000,
+        "answer": answer,
+    }
+
+
+def compare(models=MODELS):
+    """
+    Send the prompt to every model at once and print a row per model as soon
+    as it finishes, so fast models never wait on the slowest one.
+    """
+    print(
+        f"\n{'model':<28}{'latency':>9}{'ttft':>8}{'tokens':>8}{'tok/s':>8}"
+        f"{'cost $':>11}"
+    )
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=len(models)) as executor:
+        futures = {
+            executor.submit(run_model, provider, model): model
+            for provider, model, _ in models
+        }
+        for future in as_completed(futures):
+            model = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                print(f"{model:<28} failed: {e}")
+                continue
+            results[model] = row
+            tokens = "cached" if row["cached"] else row["output_tokens"]
+            print(
+                f"{model:<28}{row['latency']:>8.2f}s{row['ttft']:>7.2f}s"
+                f"{tokens:>8}{row['tokens_per_second']:>8.1f}{row['cost']:>11.6f}"
+            )
+
+    return results
+
+
+results = compare()
+
+for _, model, title in MODELS:
+    if model in results:
+        print(f"\n\n---- {title} ----\n")
+        print(results[model]["answer"])
 print("\n\n")
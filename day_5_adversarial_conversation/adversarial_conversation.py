@@ -1,11 +1,11 @@
-from openai import OpenAI
-import anthropic
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
-load_dotenv(override=True)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.llm import chat, metrics
 
-openai = OpenAI()
-claude = anthropic.Anthropic()
+load_dotenv(override=True)
 
 gpt_model = "gpt-4o-mini" 
 claude_model = "claude-3-haiku-20240307"
@@ -27,29 +27,19 @@ def call_gpt():
         messages.append({"role": "assistant", "content": gpt})
         messages.append({"role": "user", "content": claude_msg})
     
-    completion = openai.chat.completions.create(
-        model=gpt_model,
-        messages=messages
-    )
-
-    return completion.choices[0].message.content
+    return chat("openai", gpt_model, messages, site="gpt", cache=False)
 
 def call_claude():
-    messages = []
+    messages = [{"role": "system", "content": claude_system}]
     for gpt, claude_msg in zip(gpt_messages, claude_messages):
         messages.append({'role': 'user', 'content': gpt})
         messages.append({'role': 'assistant', 'content': claude_msg})
     
     messages.append({'role': 'user', 'content': gpt_messages[-1]})
-    message = claude.messages.create(
-        model=claude_model,
-        max_tokens=500,
-        system=claude_system,
-        messages=messages
+    return chat(
+        "anthropic", claude_model, messages, site="claude", cache=False, max_tokens=500
     )
 
-    return message.content[0].text
-
 print(f"GPT:\n{gpt_messages[0]}\n")
 print(f"Claude:\n{claude_messages[0]}\n")
 
@@ -60,4 +50,6 @@ for i in range(5):
 
     claude_next = call_claude()
     print(f"Claude:\n{claude_next}\n")
-    claude_messages.append(claude_next)
\ No newline at end of file
+    claude_messages.append(claude_next)
+
+print(f"Model calls: {metrics.report()}")
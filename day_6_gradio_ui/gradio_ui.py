@@ -1,12 +1,14 @@
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
-from openai import OpenAI
-import anthropic
-
-from google import genai
-from google.genai import types
 import gradio as gr
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.llm import astream, chat, metrics
+from common.providers import CONCURRENCY_LIMIT
+from common.streaming import aaccumulate, ainterleave
+
 load_dotenv(override=True)
 openai_api_key = os.getenv("OPENAI_API_KEY")
 anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
@@ -27,10 +29,6 @@ if google_api_key:
 else:
     print("Google API Key not set")
 
-openai = OpenAI()
-claude = anthropic.Anthropic()
-google = genai.Client()
-
 system_message = "You are a helpful assistant"
 
 
@@ -40,12 +38,7 @@ def message_gpt(prompt):
         {"role": "user", "content": prompt},
     ]
 
-    completion = openai.chat.completions.create(
-        messages=messages,
-        model="gpt-4o-mini",
-    )
-
-    return completion.choices[0].message.content
+    return chat("openai", "gpt-4o-mini", messages)
 
 
 # message_gpt("What is today's date?")
@@ -68,76 +61,72 @@ def shout(text):
 system_message = "You are a helpful assistant that responds in markdown"
 
 
-def stream_gpt(prompt):
-    messages = [
+def prompt_messages(prompt):
+    return [
         {"role": "system", "content": system_message},
         {"role": "user", "content": prompt},
     ]
 
-    stream = openai.chat.completions.create(
-        model="gpt-4o-mini", messages=messages, stream=True
-    )
 
-    result = ""
-
-    for chunk in stream:
-        result += chunk.choices[0].delta.content or ""
+async def stream_gpt(prompt):
+    deltas = astream("openai", "gpt-4o-mini", prompt_messages(prompt), site="gpt")
+    async for result in aaccumulate(deltas):
         yield result
 
 
-def stream_claude(prompt):
-    result = claude.messages.stream(
-        model="claude-3-haiku-20240307",
-        messages=[{"role": "user", "content": prompt}],
+async def stream_claude(prompt):
+    deltas = astream(
+        "anthropic",
+        "claude-3-haiku-20240307",
+        prompt_messages(prompt),
+        site="claude",
         temperature=0.7,
-        system=system_message,
         max_tokens=1000,
     )
-    response = ""
-
-    with result as stream:
-        for text in stream.text_stream:
-            response += text or ""
-            yield response
+    async for result in aaccumulate(deltas):
+        yield result
 
 
-def stream_gemini(prompt):
-    result = google.models.generate_content_stream(
-        config=types.GenerateContentConfig(
-            system_instruction=system_message,
-        ),
-        contents=[prompt],
-        model="gemini-2.5-flash",
+async def stream_gemini(prompt):
+    deltas = astream(
+        "gemini", "gemini-2.5-flash", prompt_messages(prompt), site="gemini"
     )
+    async for result in aaccumulate(deltas):
+        yield result
 
-    response = ""
 
-    for chunk in result:
-        response += chunk.text
-        yield response
+MODELS = {"GPT": stream_gpt, "Claude": stream_claude, "Gemini": stream_gemini}
 
 
-def stream_model(prompt, model):
-    if model == "GPT":
-        result = stream_gpt(prompt)
-    elif model == "Claude":
-        result = stream_claude(prompt)
-    elif model == "Gemini":
-        result = stream_gemini(prompt)
+async def stream_model(prompt, model):
+    if model == "All":
+        names = list(MODELS)
+    elif model in MODELS:
+        names = [model]
     else:
         raise ValueError("Unknown model")
 
-    yield from result
+    # Every selected model streams at once into its own pane; stopping the
+    # event in the UI cancels all of the streams
+    panes = {name: "" for name in MODELS}
+    async for index, result in ainterleave([MODELS[name](prompt) for name in names]):
+        panes[names[index]] = result
+        yield tuple(panes.values())
+    print(f"Model calls: {metrics.report()}")
 
 
 view = gr.Interface(
     fn=stream_model,
     inputs=[
         gr.Textbox(label="Your Message", lines=6),
-        gr.Dropdown(["GPT", "Claude", "Gemini"], label="Select model", value="GPT"),
+        gr.Dropdown(
+            ["GPT", "Claude", "Gemini", "All"], label="Select model", value="GPT"
+        ),
     ],
-    outputs=[gr.Textbox(label="Response", lines=8)],
+    outputs=[gr.Textbox(label=f"{name} Response", lines=8) for name in MODELS],
     flagging_mode="never",
 )
 
-view.launch()
+# Async handlers do not hold a worker thread per stream, so many sessions
+# can stream at once
+view.queue(default_concurrency_limit=CONCURRENCY_LIMIT).launch()
@@ -1,14 +1,26 @@
-import requests
-from bs4 import BeautifulSoup
-
 # from typing import List
+import asyncio
 import os
-from openai import OpenAI
-import anthropic
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 import json
 import gradio as gr
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.extract import extract
+from common.boilerplate import site_index
+from common.context import ContextPacker, token_budget
+from common.crawl import candidate_links
+from common.fetch import fetch_all, MAX_PER_HOST, MAX_WORKERS
+from common.http_cache import http_cache
+from common.link_classifier import classify_links
+from common.llm import achat, astream, chat, metrics
+from common.llm_cache import is_json
+from common.page_cache import PageCache
+from common.providers import CONCURRENCY_LIMIT
+from common.streaming import aaccumulate
+
 load_dotenv(override=True)
 
 openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -24,9 +36,7 @@ if not claude_api_key:
 if not google_api_key:
     print("Google key not found")
 
-
-openai = OpenAI()
-claude = anthropic.Anthropic()
+LANDING_PAGE_WEIGHT = 2  # Landing page gets twice the token share of a sub-page
 
 
 class Website:
@@ -36,24 +46,30 @@ class Website:
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
         }
 
-        response = requests.get(url, headers=headers)
+        response = http_cache.get(url, headers=headers)
         self.body = response.content
+        # Links on the page are relative to where any redirects ended
+        self.url = response.url or url
 
-        soup = BeautifulSoup(self.body, "html.parser")
-        self.title = soup.title.string if soup.title else "Title not found"
-        if soup.body:
-            for irrelevant in soup.body(["script", "style", "img", "input"]):
-                irrelevant.decompose()
-            self.text = soup.body.get_text(separator="\n", strip=True)
-        else:
-            self.text = ""
-        links = [link.get("href") for link in soup.find_all("a")]
-        self.links = [link for link in links if link]
+        # Single pass over the html, script/style/img/input content is skipped
+        page = extract(self.body)
+        self.title = page.title or "Title not found"
+        self.text = page.text
+        self.links = page.links
+        self.anchors = page.anchors
 
     def get_contents(self):
         return f"Website title:\n{self.title}\nWebsite contents:\n{self.text}\n\n"
 
 
+# One parsed page per url, shared by link selection and content extraction
+page_cache = PageCache(max_entries=128, ttl=600)
+
+
+def get_website(url):
+    return page_cache.get(url, Website)
+
+
 link_system_prompt = "You are provided with a list of links found on a webpage. \
 You are able to decide which of the links would be most relevant to include in a brochure about the company, \
 such as links to an About page, or a Company page, or Careers/Jobs pages.\n"
@@ -68,85 +84,112 @@ link_system_prompt += """
 """
 
 
-def get_links_user_prompt(website: Website):
+def get_links_user_prompt(website: Website, candidates):
     user_prompt = f"Here is the list of links on the website of {website.url} - "
     user_prompt += (
         "please decide which of these are relevant web links for a brochure about the company, respond with the full https URL in JSON format. \
 Do not include Terms of Service, Privacy, email links.\n"
     )
-    user_prompt += "Links (some might be relative links):\n"
-    user_prompt += "\n".join(website.links)
+    user_prompt += "Links:\n"
+    # Deduplicated same-site links from a short crawl, best ranked first
+    user_prompt += "\n".join(candidate.url for candidate in candidates)
     return user_prompt
 
 
 def get_links_openai(url):
-    website = Website(url)
-    user_prompt = get_links_user_prompt(website)
+    website = get_website(url)
+    candidates = candidate_links(website.url, get_website, landing=website)
+    # The local classifier answers most sites, only unclear ones go to the model
+    links, confident = classify_links(candidates)
+    if confident:
+        return links
+    user_prompt = get_links_user_prompt(website, candidates)
 
     messages = [
         {"role": "system", "content": link_system_prompt},
         {"role": "user", "content": user_prompt},
     ]
 
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini", messages=messages, response_format={"type": "json_object"}
+    answer = chat(
+        "openai",
+        "gpt-4o-mini",
+        messages,
+        site="links/openai",
+        validate=is_json,
+        response_format={"type": "json_object"},
     )
 
-    return json.loads(response.choices[0].message.content)
+    return json.loads(answer)
 
 
 def get_links_claude(url):
-    website = Website(url)
-    user_prompt = get_links_user_prompt(website)
+    website = get_website(url)
+    candidates = candidate_links(website.url, get_website, landing=website)
+    # The local classifier answers most sites, only unclear ones go to the model
+    links, confident = classify_links(candidates)
+    if confident:
+        return links
+    user_prompt = get_links_user_prompt(website, candidates)
 
     messages = [
+        {"role": "system", "content": link_system_prompt},
         {"role": "user", "content": user_prompt},
     ]
 
-    response = claude.messages.create(
-        model="claude-3-haiku-20240307",
-        system=link_system_prompt,
-        messages=messages,
+    answer = chat(
+        "anthropic",
+        "claude-3-haiku-20240307",
+        messages,
+        site="links/claude",
+        validate=is_json,
         max_tokens=600,
         temperature=0.7,
     )
 
-    return json.loads(response.content[0].text)
+    return json.loads(answer)
 
 
 # print(get_links("https://huggingface.com"))
 
 
-def get_all_details_openai(url):
-    result = "Landing Page:\n"
-    result += Website(url).get_contents()
-    links = get_links_openai(url)
+def add_page(packer, label, website, weight=1.0):
+    header = f"Website title:\n{website.title}\nWebsite contents:\n"
+    packer.add(label, website.text, header=header, weight=weight, key=website.url)
 
-    for link in links["links"]:
-        print("Getting the contents of: ", link["url"])
-        try:
-            result += f"\n\n{link['type']}\n{Website(link['url']).get_contents()}"
-        except Exception as _:
-            print(f"Getting error on {link['type']}")
-            continue
 
-    return result
+def get_all_details(url, links, model):
+    # The site's boilerplate index is kept across requests for the same host
+    packer = ContextPacker(token_budget(model), model, index=site_index(url))
+    add_page(packer, "Landing Page:", get_website(url), weight=LANDING_PAGE_WEIGHT)
+    links = links["links"]
 
+    # Fetch the sub-pages concurrently in relevance order, one batch at a time.
+    # The best ranked batch is always fetched; later batches stop once another
+    # page's share of the budget would be too small to be useful.
+    for start in range(0, len(links), MAX_WORKERS):
+        if start and packer.full:
+            print(f"Token budget full, skipping {len(links) - start} pages")
+            break
+        batch = links[start : start + MAX_WORKERS]
+        for link in batch:
+            print("Getting the contents of: ", link["url"])
 
-def get_all_details_claude(url):
-    result = "Landing Page:\n"
-    result += Website(url).get_contents()
-    links = get_links_openai(url)
+        pages = fetch_all([link["url"] for link in batch], get_website)
+        for link, page in zip(batch, pages):
+            if page is None:
+                print(f"Getting error on {link['type']}")
+                continue
+            add_page(packer, link["type"], page)
+
+    return packer.pack()
 
-    for link in links["links"]:
-        print("Getting the contents of: ", link["url"])
-        try:
-            result += f"\n\n{link['type']}\n{Website(link['url']).get_contents()}"
-        except Exception as _:
-            print(f"Getting error on {link['type']}")
-            continue
 
-    return result
+def get_all_details_openai(url):
+    return get_all_details(url, get_links_openai(url), "gpt-4o-mini")
+
+
+def get_all_details_claude(url):
+    return get_all_details(url, get_links_openai(url), "claude-3-haiku-20240307")
 
 
 system_prompt = "You are an assistant that analyzes the contents of several relevant pages from a company website \
@@ -161,60 +204,166 @@ def get_brochure_user_prompt(company_name, url, model):
         user_prompt += get_all_details_openai(url)
     elif model == "Claude":
         user_prompt += get_all_details_claude(url)
-    user_prompt = user_prompt[:5_000]  # Truncate if more than 5,000 characters
+    print(f"Page cache: {page_cache.stats()}")
     return user_prompt
 
 
-def stream_brochure_openai(company_name, url):
-    messages = [
+def brochure_messages(user_prompt):
+    return [
         {"role": "system", "content": system_prompt},
-        {"role": "user", "content": get_brochure_user_prompt(company_name, url, "GPT")},
+        {"role": "user", "content": user_prompt},
     ]
 
-    result = ""
 
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini", messages=messages, stream=True
+async def stream_openai(user_prompt):
+    deltas = astream(
+        "openai", "gpt-4o-mini", brochure_messages(user_prompt), site="brochure/openai"
     )
+    async for result in aaccumulate(deltas):
+        yield result
+
 
-    for chunk in response:
-        result += chunk.choices[0].delta.content or ""
+async def stream_claude(user_prompt):
+    deltas = astream(
+        "anthropic",
+        "claude-3-haiku-20240307",
+        brochure_messages(user_prompt),
+        site="brochure/claude",
+        temperature=0.7,
+        max_tokens=1000,
+    )
+    async for result in aaccumulate(deltas):
         yield result
 
 
-def stream_brochure_claude(company_name, url):
-    messages = [
-        {
-            "role": "user",
-            "content": get_brochure_user_prompt(company_name, url, "Claude"),
-        },
+async def stream_brochure_openai(company_name, url):
+    # Scraping and link selection block, so they run off the event loop
+    user_prompt = await asyncio.to_thread(
+        get_brochure_user_prompt, company_name, url, "GPT"
+    )
+    async for result in stream_openai(user_prompt):
+        yield result
+
+
+async def stream_brochure_claude(company_name, url):
+    user_prompt = await asyncio.to_thread(
+        get_brochure_user_prompt, company_name, url, "Claude"
+    )
+    async for result in stream_claude(user_prompt):
+        yield result
+
+
+notes_prompt = "You take notes for a company brochure. From the web page below, note the facts \
+about the company, its products, customers, culture and careers/jobs in at most 120 words. \
+Reply with the notes only."
+
+
+def notes_messages(user_prompt):
+    return [
+        {"role": "system", "content": notes_prompt},
+        {"role": "user", "content": user_prompt},
     ]
 
-    result = ""
 
-    response = claude.messages.stream(
-        model="claude-3-haiku-20240307",
-        system=system_prompt,
-        messages=messages,
-        temperature=0.7,
-        max_tokens=1000,
+async def notes_openai(user_prompt):
+    messages = notes_messages(user_prompt)
+    return await achat("openai", "gpt-4o-mini", messages, site="notes/openai")
+
+
+async def notes_claude(user_prompt):
+    return await achat(
+        "anthropic",
+        "claude-3-haiku-20240307",
+        notes_messages(user_prompt),
+        site="notes/claude",
+        max_tokens=300,
     )
 
-    with response as stream:
-        for chunk in stream.text_stream:
-            result += chunk
-            yield result
 
+PIPELINE = {
+    "GPT": ("gpt-4o-mini", get_links_openai, notes_openai, stream_openai),
+    "Claude": ("claude-3-haiku-20240307", get_links_claude, notes_claude, stream_claude),
+}
 
-def stream_model(company_name, url, model):
-    if model == "GPT":
-        result = stream_brochure_openai(company_name, url)
-    elif model == "Claude":
-        result = stream_brochure_claude(company_name, url)
-    else:
+
+async def stream_brochure_pipelined(company_name, url, model):
+    """
+    Map-reduce brochure: the landing page comes first, the other pages are
+    fetched and turned into short notes concurrently, and the brochure is
+    written from the landing page and the notes.
+    Return: (brochure so far, progress log) pairs
+    """
+    model_name, get_links, notes, stream = PIPELINE[model]
+    progress = []
+
+    def log(event):
+        progress.append(event)
+        return "\n".join(progress)
+
+    landing = await asyncio.to_thread(get_website, url)
+    yield "", log(f"✓ Landing page: {landing.title}")
+
+    links = (await asyncio.to_thread(get_links, url))["links"]
+    types = ", ".join(link["type"] for link in links)
+    yield "", log(f"Selected {len(links)} pages: {types}")
+
+    index = site_index(url)
+    fetches = asyncio.Semaphore(MAX_PER_HOST)
+
+    async def page_notes(link):
+        try:
+            async with fetches:
+                page = await asyncio.to_thread(get_website, link["url"])
+            # Each page gets the whole budget of its own notes call
+            packer = ContextPacker(token_budget(model_name), model_name, index=index)
+            add_page(packer, link["type"], page)
+            return link, await notes(packer.pack()), None
+        except Exception as e:
+            return link, None, e
+
+    landing_packer = ContextPacker(token_budget(model_name), model_name, index=index)
+    add_page(landing_packer, "Landing Page:", landing)
+
+    page_notes_by_url = {}
+    for task in asyncio.as_completed([page_notes(link) for link in links]):
+        link, text, error = await task
+        if error:
+            yield "", log(f"✗ {link['type']}: {error}")
+            continue
+        page_notes_by_url[link["url"]] = f"{link['type']}\n{text}"
+        yield "", log(f"✓ Notes from {link['type']}: {link['url']}")
+
+    user_prompt = f"You are looking at a company called: {company_name}\n"
+    user_prompt += "Here are the contents of its landing page and notes taken from other relevant pages; use this information to build a short brochure of the company in markdown.\n"
+    user_prompt += landing_packer.pack()
+    user_prompt += "\n\n" + "\n\n".join(
+        page_notes_by_url[link["url"]]
+        for link in links
+        if link["url"] in page_notes_by_url
+    )
+
+    status = log("Writing the brochure...")
+    result = ""
+    async for result in stream(user_prompt):
+        yield result, status
+    yield result, log("✓ Done")
+
+
+async def stream_model(company_name, url, model, pipelined):
+    if model not in PIPELINE:
         raise ValueError("Unknown model")
 
-    yield from result
+    if pipelined:
+        async for result in stream_brochure_pipelined(company_name, url, model):
+            yield result
+    else:
+        if model == "GPT":
+            result = stream_brochure_openai(company_name, url)
+        else:
+            result = stream_brochure_claude(company_name, url)
+        async for text in result:
+            yield text, ""
+    print(f"Model calls: {metrics.report()}")
 
 
 view = gr.Interface(
@@ -223,9 +372,13 @@ view = gr.Interface(
         gr.Textbox(label="Company Name", lines=1),
         gr.Textbox(label="Company URL", lines=1),
         gr.Dropdown(["GPT", "Claude"], label="Select model", value="GPT"),
+        gr.Checkbox(label="Pipelined (notes per page while pages load)", value=True),
+    ],
+    outputs=[
+        gr.Textbox(label="Response", lines=8),
+        gr.Textbox(label="Progress", lines=4),
     ],
-    outputs=[gr.Textbox(label="Response", lines=8)],
     flagging_mode="never",
 )
 
-view.launch()
+view.queue(default_concurrency_limit=CONCURRENCY_LIMIT).launch()
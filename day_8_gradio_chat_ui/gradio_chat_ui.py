@@ -1,35 +1,84 @@
 # import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 import gradio as gd
-from openai import OpenAI
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.history import HistoryStore, summary_messages
+from common.llm import achat, astream, metrics
+from common.providers import CONCURRENCY_LIMIT
+from common.sessions import SessionStore, completed_turns
+from common.streaming import aaccumulate
 
 load_dotenv(override=True)
 
-openai = OpenAI()
+MODEL = "gpt-4o-mini"
 
 system_message = (
     "You are a friendly user assistant. Patiently analyse and give reply technically."
 )
 
 
-def chat(message, history):
-    messages = [{"role": "system", "content": system_message}]
-    for user_msg, assistant_msg in history:
-        messages.append({"role": "user", "content": user_msg})
-        messages.append({"role": "assistant", "content": assistant_msg})
+# The full conversation of each session is kept on the server, so the browser
+# only sends the new message
+sessions = SessionStore()
+# Per-session history kept within a token budget, older turns are summarized
+history_store = HistoryStore(model=MODEL)
 
-    messages.append({"role": "user", "content": message})
 
-    stream = openai.chat.completions.create(
-        model="gpt-4o-mini", messages=messages, stream=True
-    )
+async def compact(session):
+    turns = session.to_compact()
+    if not turns:
+        return
+    # Only the turns leaving the window are summarized, into the running summary
+    messages = summary_messages(session.summary, turns)
+    summary = await achat("openai", MODEL, messages, site="chat/summary", cache=False)
+    session.compacted(turns, summary)
+
+
+def get_history(session_id):
+    session = history_store.get(session_id)
+    if not session.seen:
+        # Rebuilt from the stored conversation after an eviction or a restart
+        session.sync(completed_turns(sessions.get(session_id)))
+    return session
+
+
+async def chat(message, request: gd.Request):
+    session_id = request.session_hash
+    session = get_history(session_id)
+    await compact(session)
+    messages = session.messages(system_message, message)
 
+    conversation = sessions.get(session_id) + [{"role": "user", "content": message}]
+    yield conversation, ""
+
+    deltas = astream("openai", MODEL, messages, site="chat/answer", cache=False)
     response = ""
+    async for response in aaccumulate(deltas):
+        yield conversation + [{"role": "assistant", "content": response}], ""
+
+    sessions.append(
+        session_id, conversation[-1], {"role": "assistant", "content": response}
+    )
+    session.add_turn(message, response)
+    print(f"Model calls: {metrics.report()}")
+
+
+def clear(request: gd.Request):
+    sessions.clear(request.session_hash)
+    history_store.get(request.session_hash).reset()
+    return []
 
-    for chunk in stream:
-        response += chunk.choices[0].delta.content or ""
 
-        yield response
+with gd.Blocks() as view:
+    chatbot = gd.Chatbot(type="messages")
+    message = gd.Textbox(placeholder="Type a message...", show_label=False)
+    clear_button = gd.Button("Clear")
 
+    # Only the new message goes to the server, the history stays there
+    message.submit(chat, inputs=message, outputs=[chatbot, message])
+    clear_button.click(clear, outputs=chatbot)
 
-gd.ChatInterface(fn=chat).launch()
+view.queue(default_concurrency_limit=CONCURRENCY_LIMIT).launch()
@@ -1,9 +1,17 @@
 import os
-import json
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
-from openai import OpenAI
 import gradio as gd
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.fares import FareStore, SqliteFareStore
+from common.llm import ModelCall, metrics, openai_usage
+from common.providers import async_openai, CONCURRENCY_LIMIT
+from common.sessions import SessionStore
+from common.streaming import aaccumulate
+from common.tools import ToolMemo, ToolRunner, known_results
+
 load_dotenv(override=True)
 
 open_api_key = os.getenv("OPENAI_API_KEY")
@@ -12,30 +20,41 @@ if not open_api_key:
     print("Open API Key not found")
 
 MODEL = "gpt-4o-mini"
-openai = OpenAI()
 
 system_message = "You are a helpful assistant for an Airline called FlightAI. "
 system_message += "Give short, courteous answers, no more then 1 sentence. "
 system_message += "Always be accurate. If you don't know the answer. Say so."
 
 
+city_prices = {
+    "varanasi": "₹20000",
+    "tirupathi": "₹4000",
+    "ujjain": "₹8000",
+    "ayodhya": "₹9000",
+    "madhura": "₹12000",
+    "vrindhavan": "₹10000",
+    "belur": "₹19000",
+}
+city_aliases = {"madhura": ["mathura"], "vrindhavan": ["vrindavan", "brindavan"]}
+
+# Set FARE_DB to a SQLite fare sheet to serve it instead of the prices above
+fare_db = os.getenv("FARE_DB")
+if fare_db:
+    fares = SqliteFareStore(fare_db)
+else:
+    fares = FareStore()
+    for city, price in city_prices.items():
+        fares.add(city, price)
+    for city, aliases in city_aliases.items():
+        fares.add_aliases(city, aliases)
+
+
 def get_ticket_price(destination_city):
     """
-    Argument: city
+    Argument: city, spelling variants and small typos are matched
     Return: price_in_rupees
     """
-    city_prices = {
-        "varanasi": "₹20000",
-        "tirupathi": "₹4000",
-        "ujjain": "₹8000",
-        "ayodhya": "₹9000",
-        "madhura": "₹12000",
-        "vrindhavan": "₹10000",
-        "belur": "₹19000",
-    }
-    city = destination_city.lower()
-
-    return city_prices.get(city, "Unknown")
+    return fares.price(destination_city) or "Unknown"
 
 
 price_function = {
@@ -57,38 +76,86 @@ price_function = {
 tools = [{"type": "function", "function": price_function}]
 
 
-def handle_tool_call(message):
-    tool_call = message.tool_calls[0]
-    arguments = json.loads(tool_call.function.arguments)
-    city = arguments.get("destination_city")
-    price = get_ticket_price(city)
-    response = {
-        "role": "tool",
-        "content": json.dumps({"destination_city": city, "price": price}),
-        "tool_call_id": message.tool_calls[0].id,
-    }
-
-    return response, city
-
-
-def chat(message, history):
-    messages = [{"role": "system", "content": system_message}]
-    for human, assistant in history:
-        messages.append({"role": "user", "content": human})
-        messages.append({"role": "assistant", "content": assistant})
-    messages.append({"role": "user", "content": message})
-    response = openai.chat.completions.create(
-        model=MODEL, messages=messages, tools=tools
-    )
-
-    if response.choices[0].finish_reason == "tool_calls":
-        message = response.choices[0].message
-        response, city = handle_tool_call(message)
-        messages.append(message)
-        messages.append(response)
-        response = openai.chat.completions.create(model=MODEL, messages=messages)
-
-    return response.choices[0].message.content
-
-
-gd.ChatInterface(fn=chat).launch()
+def ticket_price_tool(destination_city):
+    price = get_ticket_price(destination_city)
+    return {"destination_city": destination_city, "price": price}
+
+
+# Tools start while the reply is still streaming; results are kept per session
+tool_runner = ToolRunner({"get_ticket_price": ticket_price_tool})
+tool_memo = ToolMemo()
+
+# The full conversation of each session is kept on the server, so the browser
+# only sends the new message
+sessions = SessionStore()
+
+
+async def stream_chat(messages, final):
+    # Tools, then the system message, then the conversation: the same prefix on
+    # every call, so OpenAI can serve it from its prompt cache. The last round
+    # keeps the tools but may not call them. The tool call fragments are needed
+    # as they stream, so the raw chunks are passed on and only timed here.
+    site = "airline/tool_answer" if messages[-1]["role"] == "tool" else "airline/chat"
+    async with ModelCall("openai", MODEL, site, streamed=True) as call:
+        await call.asend()
+        response = await async_openai().chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            tools=tools,
+            tool_choice="none" if final else "auto",
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async with response:
+            async for chunk in response:
+                if chunk.usage:
+                    call.usage(*openai_usage(chunk.usage))
+                if chunk.choices and (
+                    chunk.choices[0].delta.content or chunk.choices[0].delta.tool_calls
+                ):
+                    call.token()
+                yield chunk
+
+
+async def chat(message, request: gd.Request):
+    session_id = request.session_hash
+    user_message = {"role": "user", "content": message}
+    conversation = sessions.get(session_id) + [user_message]
+    yield conversation, ""
+
+    memo = tool_memo.get(session_id)
+    messages = [{"role": "system", "content": system_message}, *conversation]
+    # Prices looked up earlier in the session are answered without a tool call.
+    # They grow as the session goes on, so they come after the conversation and
+    # the cached prefix (tools, system message, earlier turns) stays the same.
+    known = known_results(memo)
+    if known:
+        messages.append(known)
+
+    # Text streams as it arrives, also in the answer that follows a tool call
+    response = ""
+    async for response in aaccumulate(tool_runner.stream(stream_chat, messages, memo)):
+        yield conversation + [{"role": "assistant", "content": response}], ""
+
+    # Only the user message and the final answer are kept for later turns
+    answer = {"role": "assistant", "content": response}
+    sessions.append(session_id, user_message, answer)
+    print(f"Model calls: {metrics.report()}")
+
+
+def clear(request: gd.Request):
+    sessions.clear(request.session_hash)
+    tool_memo.clear(request.session_hash)
+    return []
+
+
+with gd.Blocks() as view:
+    chatbot = gd.Chatbot(type="messages")
+    message = gd.Textbox(placeholder="Type a message...", show_label=False)
+    clear_button = gd.Button("Clear")
+
+    # Only the new message goes to the server, the history stays there
+    message.submit(chat, inputs=message, outputs=[chatbot, message])
+    clear_button.click(clear, outputs=chatbot)
+
+view.queue(default_concurrency_limit=CONCURRENCY_LIMIT).launch()